@@ -0,0 +1,154 @@
+"""
+Runs the course scenarios, the `run_*` functions of the unit scripts.
+
+    python -m src list
+    python -m src run orchestration
+    python -m src run orchestration --import-report
+
+Scenarios are discovered by parsing the scripts, so listing them imports nothing, and
+`run` only imports the one script that defines the scenario.
+"""
+
+import argparse
+import ast
+import importlib
+import inspect
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+SCENARIO_PACKAGES = ("unit1_intro", "unit2_frameworks")
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def discover_scenarios() -> dict[str, tuple[str, str]]:
+    """Map scenario names to (module, function), e.g. "orchestration" -> run_orchestration."""
+    scenarios = {}
+    for package in SCENARIO_PACKAGES:
+        for path in sorted((SRC_DIR / package).rglob("*.py")):
+            module = ".".join(path.relative_to(SRC_DIR).with_suffix("").parts)
+            for node in ast.parse(path.read_text()).body:
+                if isinstance(
+                    node, ast.FunctionDef | ast.AsyncFunctionDef
+                ) and node.name.startswith("run_"):
+                    name = node.name.removeprefix("run_")
+                    if name in scenarios:
+                        # Qualify clashing names with the script they come from
+                        name = f"{path.stem}.{name}"
+                    scenarios[name] = (module, node.name)
+    return scenarios
+
+
+def run_scenario(module_name: str, function_name: str, login: bool) -> None:
+    from config import settings
+
+    if login and settings.HF_TOKEN:
+        # huggingface_hub picks the token up from the environment, which avoids the
+        # network round trip and token file write that `login()` does on every start
+        os.environ.setdefault("HF_TOKEN", settings.HF_TOKEN)
+
+    start = time.perf_counter()
+    function = getattr(importlib.import_module(module_name), function_name)
+    imported = time.perf_counter()
+    result = function()
+    if inspect.iscoroutine(result):
+        import asyncio
+
+        asyncio.run(result)
+    done = time.perf_counter()
+    print(
+        f"[{function_name}] import {imported - start:.2f}s, run {done - imported:.2f}s",
+        file=sys.stderr,
+    )
+
+
+def import_report(lines: list[str], top: int) -> str:
+    """Summarize `python -X importtime` output: slowest modules and cost per package."""
+    modules = []
+    per_package = defaultdict(int)
+    for line in lines:
+        match = IMPORT_TIME_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, _, module = match.groups()
+        modules.append((int(cumulative_us), int(self_us), module))
+        per_package[module.split(".")[0]] += int(self_us)
+
+    report = [f"{'cumulative':>12} {'self':>10}  module"]
+    for cumulative_us, self_us, module in sorted(modules, reverse=True)[:top]:
+        report.append(f"{cumulative_us / 1e3:10.1f}ms {self_us / 1e3:8.1f}ms  {module}")
+    report.append("")
+    report.append(f"{'self total':>12}  top-level package")
+    for package, self_us in sorted(
+        per_package.items(), key=lambda item: item[1], reverse=True
+    )[:top]:
+        report.append(f"{self_us / 1e3:10.1f}ms  {package}")
+    total_us = sum(per_package.values())
+    report.append(f"{total_us / 1e3:10.1f}ms  total across {len(modules)} modules")
+    return "\n".join(report)
+
+
+def run_with_import_report(argv: list[str], top: int) -> int:
+    """Re-run the command under `-X importtime`, passing everything but the timings through."""
+    import subprocess
+
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", __file__, *argv],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    import_lines = []
+    for line in process.stderr:
+        if line.startswith("import time:"):
+            import_lines.append(line.rstrip("\n"))
+        else:
+            sys.stderr.write(line)
+    returncode = process.wait()
+    print(import_report(import_lines, top), file=sys.stderr)
+    return returncode
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="python -m src", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the available scenarios")
+    run = commands.add_parser("run", help="Run one scenario")
+    run.add_argument("scenario", help="Scenario name, as shown by `list`")
+    run.add_argument(
+        "--no-login", action="store_true", help="Don't export HF_TOKEN from settings"
+    )
+    run.add_argument(
+        "--import-report",
+        action="store_true",
+        help="Report which imports the scenario spends its startup time on",
+    )
+    run.add_argument("--top", type=int, default=25, help="Rows in the import report")
+    args = parser.parse_args(argv)
+
+    scenarios = discover_scenarios()
+    if args.command == "list":
+        width = max(map(len, scenarios))
+        for name, (module, function_name) in scenarios.items():
+            print(f"{name:<{width}}  {module}.{function_name}")
+        return 0
+
+    if args.scenario not in scenarios:
+        parser.error(
+            f"unknown scenario {args.scenario!r}, choose from: {', '.join(scenarios)}"
+        )
+    if args.import_report:
+        passthrough = [arg for arg in argv if arg != "--import-report"]
+        return run_with_import_report(passthrough, args.top)
+    run_scenario(*scenarios[args.scenario], login=not args.no_login)
+    return 0
+
+
+if __name__ == "__main__":
+    # Scripts import `config` and `common` as top-level modules, as when run from src/
+    sys.path.insert(0, str(SRC_DIR))
+    sys.exit(main())
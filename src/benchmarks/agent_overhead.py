@@ -0,0 +1,271 @@
+"""
+Measures how much of an agent run is our own overhead rather than model latency.
+
+Every scenario runs against StubModelServer, which answers from a script after a fixed
+artificial latency, so whatever a step takes on top of its model call is framework
+overhead: prompt assembly, code parsing, tool dispatch and memory serialization.
+
+Run from `src/`:
+    python -m benchmarks.agent_overhead --latency 0.2 --repeat 10 --output overhead.json
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import time
+from contextlib import ExitStack
+from datetime import UTC, datetime
+from unittest import mock
+
+import smolagents
+from smolagents import CodeAgent, OpenAIServerModel, ToolCallingAgent
+
+from benchmarks.stub_model_server import StubModelServer
+
+SCENARIO_PACKAGE = "unit2_frameworks.2_1_smolagents"
+
+
+def code(snippet: str, thought: str = "Scripted step.") -> str:
+    return f"Thought: {thought}\nCode:\n```py\n{snippet}\n```<end_code>"
+
+
+# "<module>.<run_* function>" -> scripted model responses, one per step
+SCENARIOS = {
+    "1_code_agents.run_search_music": [
+        code('final_answer("Queen, Daft Punk and the Batman (1989) soundtrack")'),
+    ],
+    "1_code_agents.run_suggest_menu": [
+        code('menu = suggest_menu(occasion="formal")\nprint(menu)'),
+        code("final_answer(menu)"),
+    ],
+    "1_code_agents.run_prep_time": [
+        code(
+            "import datetime\n"
+            "ready = datetime.datetime.now() + datetime.timedelta(minutes=30 + 60 + 45 + 45)\n"
+            "print(ready)"
+        ),
+        code("final_answer(str(ready))"),
+    ],
+    "1_code_agents.run_hf_alfred_agent": [
+        code(
+            'theme = superhero_party_theme_generator(category="villain masquerade")\n'
+            "print(theme)"
+        ),
+        code(
+            'menu = suggest_menu(occasion="superhero")\n'
+            'caterer = catering_service_tool(query="best catering in Gotham")\n'
+            "print(menu, caterer)"
+        ),
+        code('final_answer(f"{theme}\\n{menu}\\n{caterer}")'),
+    ],
+    "2_tool_agents.run_simple_tool": [
+        {
+            "tool_calls": [
+                {
+                    "name": "final_answer",
+                    "arguments": {"answer": "Queen, Daft Punk and Hans Zimmer"},
+                }
+            ]
+        },
+    ],
+    "2_tool_agents.run_catering_service": [
+        code('final_answer(catering_service_tool(query="catering"))'),
+    ],
+    "2_tool_agents.run_party_theme": [
+        code(
+            'final_answer(superhero_party_theme_generator(category="villain masquerade"))'
+        ),
+    ],
+    "3_retrieval_agents.run_retrieval_duckduckgo": [
+        code('final_answer("Gold and velvet decor, a themed DJ and superhero dishes")'),
+    ],
+    "3_retrieval_agents.run_search_vecdb": [
+        code(
+            'ideas = party_planning_retriever(query="luxury superhero party entertainment catering decoration")\n'
+            "print(ideas)"
+        ),
+        code("final_answer(ideas)"),
+    ],
+}
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile, `q` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+class StepRecorder:
+    """
+    Step callback that splits each step into model time and everything else.
+    """
+
+    def __init__(self, server: StubModelServer):
+        self.server = server
+        self.steps: list[dict] = []
+        self.model_seconds: list[float] = []
+        self._model_calls_seen = 0
+        self._requests_seen = 0
+        self._last_step_end = time.perf_counter()
+
+    def reset(self) -> None:
+        self._model_calls_seen = len(self.model_seconds)
+        self._requests_seen = len(self.server.records)
+        self._last_step_end = time.perf_counter()
+
+    def on_step(self, step_log, agent) -> None:
+        now = time.perf_counter()
+        duration = getattr(step_log, "duration", None) or now - self._last_step_end
+        self._last_step_end = now
+
+        # Model calls since the previous step belong to this one (planning included)
+        model_seconds = sum(self.model_seconds[self._model_calls_seen :])
+        self._model_calls_seen = len(self.model_seconds)
+        requests = self.server.records[self._requests_seen :]
+        self._requests_seen += len(requests)
+
+        self.steps.append(
+            {
+                "duration": duration,
+                "model_seconds": model_seconds,
+                "server_seconds": sum(record.service_seconds for record in requests),
+                "overhead_seconds": max(duration - model_seconds, 0.0),
+                "bytes_sent": sum(record.bytes_in for record in requests),
+                "bytes_received": sum(record.bytes_out for record in requests),
+            }
+        )
+
+    def stub_model(self, *args, **kwargs) -> OpenAIServerModel:
+        recorder = self
+
+        class TimedStubModel(OpenAIServerModel):
+            def __call__(self, *call_args, **call_kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().__call__(*call_args, **call_kwargs)
+                finally:
+                    recorder.model_seconds.append(time.perf_counter() - start)
+
+        return TimedStubModel(
+            model_id="stub", api_base=self.server.api_base, api_key="stub"
+        )
+
+    def instrumented(self, agent_cls):
+        recorder = self
+
+        class Instrumented(agent_cls):
+            def __init__(self, *args, step_callbacks=None, **kwargs):
+                super().__init__(
+                    *args,
+                    step_callbacks=[*(step_callbacks or []), recorder.on_step],
+                    **kwargs,
+                )
+
+        Instrumented.__name__ = agent_cls.__name__
+        return Instrumented
+
+
+def run_scenario(server: StubModelServer, name: str, script: list, repeat: int) -> dict:
+    module_name, function_name = name.rsplit(".", 1)
+    module = importlib.import_module(f"{SCENARIO_PACKAGE}.{module_name}")
+    recorder = StepRecorder(server)
+
+    wall_seconds, steps_per_run = [], []
+    with ExitStack() as stack:
+        # Point every model the scenario builds at the stub, and hook our step callback in
+        for attr in ("HfApiModel", "OpenAIServerModel"):
+            if hasattr(module, attr):
+                stack.enter_context(
+                    mock.patch.object(module, attr, recorder.stub_model)
+                )
+        for agent_cls in (CodeAgent, ToolCallingAgent):
+            if hasattr(module, agent_cls.__name__):
+                stack.enter_context(
+                    mock.patch.object(
+                        module, agent_cls.__name__, recorder.instrumented(agent_cls)
+                    )
+                )
+
+        for _ in range(repeat):
+            server.load_script(script)
+            recorder.reset()
+            steps_before = len(recorder.steps)
+            start = time.perf_counter()
+            getattr(module, function_name)()
+            wall_seconds.append(time.perf_counter() - start)
+            steps_per_run.append(len(recorder.steps) - steps_before)
+
+    steps = recorder.steps
+    return {
+        "runs": repeat,
+        "total_steps": len(steps),
+        "steps_per_run": summarize(steps_per_run),
+        "wall_ms": summarize([s * 1000 for s in wall_seconds]),
+        "step_ms": summarize([step["duration"] * 1000 for step in steps]),
+        "model_ms": summarize([step["model_seconds"] * 1000 for step in steps]),
+        "server_ms": summarize([step["server_seconds"] * 1000 for step in steps]),
+        "overhead_ms": summarize([step["overhead_seconds"] * 1000 for step in steps]),
+        "bytes_sent_per_step": summarize([step["bytes_sent"] for step in steps]),
+        "bytes_received_per_step": summarize(
+            [step["bytes_received"] for step in steps]
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per model call"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario")
+    parser.add_argument("--output", default="agent_overhead.json")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Only run these scenarios (repeatable)",
+    )
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "smolagents": smolagents.__version__,
+            "latency_seconds": args.latency,
+            "repeat": args.repeat,
+        },
+        "scenarios": {},
+    }
+    with StubModelServer(latency=args.latency) as server:
+        for name in args.scenario or SCENARIOS:
+            result = run_scenario(server, name, SCENARIOS[name], args.repeat)
+            report["scenarios"][name] = result
+            print(
+                f"{name}: {result['total_steps']} steps,"
+                f" overhead p50={result['overhead_ms']['p50'] or 0:.1f}ms"
+                f" p99={result['overhead_ms']['p99'] or 0:.1f}ms,"
+                f" {result['bytes_sent_per_step']['p50']} bytes/step"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Self
+
+FALLBACK_RESPONSE = """Thought: The script is exhausted, finishing.
+Code:
+```py
+final_answer("stub server script exhausted")
+```<end_code>"""
+
+
+@dataclass
+class RequestRecord:
+    received_at: float
+    bytes_in: int
+    bytes_out: int
+    service_seconds: float
+
+
+class StubModelServer:
+    """
+    A local OpenAI-compatible `/v1/chat/completions` endpoint that replies from a script.
+
+    Each scripted response is either a string (the assistant content) or a dict with
+    `tool_calls`, a list of {"name": ..., "arguments": {...}}, for tool-calling agents.
+    Every reply is delayed by `latency` seconds to stand in for model time.
+
+    Usage:
+        with StubModelServer(latency=0.2) as server:
+            server.load_script(["Code:\\n```py\\nfinal_answer('done')\\n```<end_code>"])
+            model = OpenAIServerModel("stub", api_base=server.api_base, api_key="stub")
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.records: list[RequestRecord] = []
+        self._script: list = []
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                start = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+
+                request = json.loads(body)
+                time.sleep(server.latency)
+                payload = json.dumps(
+                    server._completion(request.get("model", "stub"), len(body))
+                ).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+                with server._lock:
+                    server.records.append(
+                        RequestRecord(
+                            received_at=start,
+                            bytes_in=len(body),
+                            bytes_out=len(payload),
+                            service_seconds=time.perf_counter() - start,
+                        )
+                    )
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def api_base(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def load_script(self, responses: list) -> None:
+        with self._lock:
+            self._script = list(responses)
+
+    def _next_response(self):
+        with self._lock:
+            return self._script.pop(0) if self._script else FALLBACK_RESPONSE
+
+    def _completion(self, model: str, bytes_in: int) -> dict:
+        response = self._next_response()
+        if isinstance(response, dict):
+            message = {
+                "role": "assistant",
+                "content": response.get("content"),
+                "tool_calls": [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {
+                            "name": call["name"],
+                            "arguments": json.dumps(call["arguments"]),
+                        },
+                    }
+                    for call in response["tool_calls"]
+                ],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": response}
+            finish_reason = "stop"
+
+        # Rough token counts, 4 bytes per token, so token accounting has something to show
+        prompt_tokens = bytes_in // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def start(self) -> "StubModelServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
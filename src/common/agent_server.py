@@ -0,0 +1,362 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from smolagents import MultiStepAgent
+from smolagents.memory import ActionStep
+from smolagents.utils import AgentMaxStepsError
+
+
+class ServerOverloadedError(Exception):
+    """Raised when a request arrives while every agent is busy and the queue is full."""
+
+
+class RequestTimeoutError(Exception):
+    """Raised when a request runs out of time, in the queue or between agent steps."""
+
+
+class AgentRunError(Exception):
+    """Raised when the agent fails a request, the agent's error is the cause."""
+
+
+@dataclass
+class RunResult:
+    answer: object
+    steps: int
+    queue_seconds: float
+    run_seconds: float
+
+
+def _isolate(agent: MultiStepAgent) -> None:
+    """Forget everything a request left in the agent, so the next one starts clean."""
+    agent.memory.reset()
+    agent.monitor.reset()
+    agent.state.clear()
+    executor = getattr(agent, "python_executor", None)
+    if executor is not None:
+        if hasattr(executor, "release"):
+            # PooledPythonExecutor: the worker process and its variables go back to the pool
+            executor.release()
+        else:
+            executor.state.clear()
+            executor.custom_tools.clear()
+    for managed_agent in agent.managed_agents.values():
+        _isolate(managed_agent)
+
+
+class AgentServer:
+    """
+    Runs many agent requests concurrently on a pool of prebuilt agents.
+
+    - `size` agents are built by `agent_factory` up front and each request leases one for
+      the length of its run, so no two requests ever share an agent's memory. Its
+      memory, state and executor variables are wiped before it goes back to the pool.
+    - Admission control: at most `size` requests run and `max_queue` wait. Past that
+      `submit` raises ServerOverloadedError immediately instead of queueing unboundedly.
+    - Limits: each request gets at most `max_steps` steps and `timeout` seconds, counted
+      from submission. A request whose time runs out in the queue never starts; one that
+      runs out mid-run stops before its next step.
+
+    Agents run on threads, a run is mostly waiting on the model, so hundreds of runs fit
+    in one process.
+
+    Usage:
+        server = AgentServer(lambda: CodeAgent(tools=[...], model=...), size=64)
+        result = server.submit("Plan the party").result()
+        serve_http(server, port=8000).serve_forever()
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], MultiStepAgent],
+        size: int = 32,
+        max_queue: int = 256,
+        max_steps: int = 10,
+        timeout: float = 300.0,
+        metrics_window: int = 10_000,
+    ):
+        self.size = size
+        self.max_queue = max_queue
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            # Callers that stopped waiting, whatever became of the run
+            "abandoned": 0,
+        }
+        self._queue_seconds: deque[float] = deque(maxlen=metrics_window)
+        self._latency_seconds: deque[float] = deque(maxlen=metrics_window)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._slots = threading.BoundedSemaphore(size + max_queue)
+
+        self._idle_agents: queue.SimpleQueue[MultiStepAgent] = queue.SimpleQueue()
+        for _ in range(size):
+            self._idle_agents.put(self._prepare(agent_factory()))
+        self._executor = ThreadPoolExecutor(size, thread_name_prefix="agent")
+
+    @staticmethod
+    def _prepare(agent: MultiStepAgent) -> MultiStepAgent:
+        step = agent.step
+        provide_final_answer = agent.provide_final_answer
+        agent.request_deadline = None
+
+        def check_deadline(before: str) -> None:
+            if (
+                agent.request_deadline is not None
+                and time.perf_counter() > agent.request_deadline
+            ):
+                raise RequestTimeoutError(f"Out of time before {before}")
+
+        def step_before_deadline(memory_step: ActionStep):
+            # Checked before the step rather than after, so a final answer is never dropped
+            check_deadline(f"step {memory_step.step_number}")
+            return step(memory_step)
+
+        def final_answer_before_deadline(*args, **kwargs):
+            # The extra model call smolagents makes once max_steps is reached
+            check_deadline("the max steps answer")
+            return provide_final_answer(*args, **kwargs)
+
+        agent.step = step_before_deadline
+        agent.provide_final_answer = final_answer_before_deadline
+        return agent
+
+    def submit(
+        self, task: str, max_steps: int | None = None, timeout: float | None = None
+    ) -> Future:
+        """Queue `task`, the future resolves to a RunResult. Limits are capped at the server's."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise ServerOverloadedError(
+                f"{self.size} requests running and {self.max_queue} queued"
+            )
+        max_steps = min(max_steps or self.max_steps, self.max_steps)
+        timeout = min(timeout or self.timeout, self.timeout)
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.stats["accepted"] += 1
+            self._waiting += 1
+        future = self._executor.submit(
+            self._run, task, max_steps, submitted_at, submitted_at + timeout
+        )
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(
+        self, task: str, max_steps: int, submitted_at: float, deadline: float
+    ) -> RunResult:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            self._queue_seconds.append(started_at - submitted_at)
+        agent = self._idle_agents.get()
+        try:
+            if started_at > deadline:
+                raise RequestTimeoutError("Out of time before leaving the queue")
+            agent.max_steps = max_steps
+            agent.request_deadline = deadline
+            answer = agent.run(task)
+            if time.perf_counter() > deadline:
+                # The last model call ran past the deadline, the caller has given up
+                raise RequestTimeoutError("Answered after the deadline")
+            steps = sum(
+                isinstance(step, ActionStep)
+                # Not a step, the answer smolagents asks for after max_steps
+                and not isinstance(step.error, AgentMaxStepsError)
+                for step in agent.memory.steps
+            )
+            result = RunResult(
+                answer,
+                steps,
+                started_at - submitted_at,
+                time.perf_counter() - started_at,
+            )
+            outcome = "completed"
+            return result
+        except RequestTimeoutError:
+            outcome = "timed_out"
+            raise
+        except Exception as e:
+            outcome = "failed"
+            raise AgentRunError(f"{type(e).__name__}: {e}") from e
+        finally:
+            agent.request_deadline = None
+            _isolate(agent)
+            self._idle_agents.put(agent)
+            with self._lock:
+                self._running -= 1
+                self.stats[outcome] += 1
+                self._latency_seconds.append(time.perf_counter() - submitted_at)
+
+    def run(
+        self, task: str, max_steps: int | None = None, timeout: float | None = None
+    ) -> RunResult:
+        """
+        Submit and wait. Gives up waiting at the deadline even if the agent is still in a
+        model call; the run itself stops before its next step.
+        """
+        timeout = min(timeout or self.timeout, self.timeout)
+        future = self.submit(task, max_steps, timeout)
+        try:
+            # A little grace, so a run that stops at its deadline reports its own error
+            return future.result(timeout + 1.0)
+        except FutureTimeoutError:
+            with self._lock:
+                self.stats["abandoned"] += 1
+            raise RequestTimeoutError(f"No answer within {timeout:.0f}s") from None
+
+    def metrics(self) -> dict:
+        """Counters, current load and queue wait / end-to-end latency percentiles."""
+        with self._lock:
+            metrics = {
+                **self.stats,
+                "waiting": self._waiting,
+                "running": self._running,
+                "agents": self.size,
+                "max_queue": self.max_queue,
+            }
+            samples = {
+                "queue_seconds": np.array(self._queue_seconds),
+                "latency_seconds": np.array(self._latency_seconds),
+            }
+        for name, values in samples.items():
+            if len(values):
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                metrics[name] = {
+                    "p50": round(float(p50), 4),
+                    "p95": round(float(p95), 4),
+                    "p99": round(float(p99), 4),
+                    "max": round(float(values.max()), 4),
+                }
+        return metrics
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _optional_positive(value, types) -> bool:
+    return value is None or (
+        isinstance(value, types) and not isinstance(value, bool) and value > 0
+    )
+
+
+def serve_http(
+    server: AgentServer, host: str = "127.0.0.1", port: int = 8000
+) -> ThreadingHTTPServer:
+    """
+    A JSON API in front of `server`, call `serve_forever()` on the result.
+
+        POST /run      {"task": "...", "max_steps": 5, "timeout": 60}
+                       200 {"answer", "steps", "queue_seconds", "run_seconds"}
+                       400 bad request, 429 queue full (with Retry-After),
+                       504 out of time, 500 agent error
+        GET  /metrics  AgentServer.metrics()
+        GET  /healthz  200 while the server is up
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+            payload = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._reply(200, server.metrics())
+            elif self.path == "/healthz":
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": f"No route {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/run":
+                self._reply(404, {"error": f"No route {self.path}"})
+                return
+            try:
+                request = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                task = request["task"]
+            except (KeyError, TypeError, ValueError):
+                self._reply(400, {"error": 'Expected a JSON body with a "task"'})
+                return
+            if not (
+                isinstance(task, str)
+                and _optional_positive(request.get("max_steps"), int)
+                and _optional_positive(request.get("timeout"), (int, float))
+            ):
+                self._reply(
+                    400,
+                    {
+                        "error": '"task" must be a string, "max_steps" a positive '
+                        'integer and "timeout" a positive number'
+                    },
+                )
+                return
+
+            try:
+                result = server.run(
+                    task, request.get("max_steps"), request.get("timeout")
+                )
+            except ServerOverloadedError as e:
+                self._reply(429, {"error": str(e)}, {"Retry-After": "1"})
+            except RequestTimeoutError as e:
+                self._reply(504, {"error": str(e)})
+            except AgentRunError as e:
+                self._reply(500, {"error": str(e)})
+            else:
+                self._reply(
+                    200,
+                    {
+                        "answer": result.answer,
+                        "steps": result.steps,
+                        "queue_seconds": round(result.queue_seconds, 4),
+                        "run_seconds": round(result.run_seconds, 4),
+                    },
+                )
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Let connections beyond the admitted requests in, so they get a 429 rather than
+        # a refused connection
+        request_queue_size = server.size + server.max_queue
+
+    return Server((host, port), Handler)
+
+
+def gradio_app(server: AgentServer):
+    """A minimal gradio front end on the same pool, as an alternative to serve_http."""
+    import gradio as gr
+
+    def answer(task: str) -> str:
+        try:
+            return str(server.run(task).answer)
+        except (ServerOverloadedError, RequestTimeoutError) as e:
+            raise gr.Error(str(e)) from e
+
+    return gr.Interface(fn=answer, inputs="text", outputs="text").queue(
+        default_concurrency_limit=server.size + server.max_queue
+    )
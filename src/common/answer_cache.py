@@ -0,0 +1,298 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from smolagents import MultiStepAgent
+from smolagents.agent_types import AgentType
+from smolagents.utils import AgentMaxStepsError
+
+
+def _task_key(task: str) -> str:
+    """Tasks that only differ in case and whitespace share a key."""
+    normalized = re.sub(r"\s+", " ", task).strip().lower()
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def hf_embedder(model: str = "BAAI/bge-small-en-v1.5") -> Callable[[str], np.ndarray]:
+    """Embeds text with the HF Inference API, the model sdr() embeds documents with."""
+    from huggingface_hub import InferenceClient
+
+    client = InferenceClient()
+
+    def embed(text: str) -> np.ndarray:
+        vector = np.asarray(client.feature_extraction(text, model=model), np.float32)
+        # Some models return one vector per token, pool them
+        return vector.reshape(-1, vector.shape[-1]).mean(axis=0)
+
+    return embed
+
+
+def agent_fingerprint(agent: MultiStepAgent, include_model: bool = True) -> str:
+    """
+    A hash of what the agent can do: its tools, managed agents and (optionally) model, so
+    answers given with one tool set are not served to an agent with another.
+    """
+    fingerprint = {
+        "class": type(agent).__name__,
+        "tools": sorted(
+            (tool.name, tool.description, json.dumps(tool.inputs, sort_keys=True))
+            for tool in agent.tools.values()
+        ),
+        "managed_agents": sorted(
+            (name, agent_fingerprint(managed, include_model))
+            for name, managed in agent.managed_agents.items()
+        ),
+    }
+    if include_model:
+        fingerprint["model"] = getattr(agent.model, "model_id", None)
+    payload = json.dumps(fingerprint, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+@dataclass
+class AnswerHit:
+    answer: object
+    task: str  # The cached task, which may differ slightly from the one asked
+    similarity: float
+    run_seconds: float  # How long the run that produced the answer took
+
+
+class SemanticAnswerCache:
+    """
+    Final answers of agent runs, looked up by the task's meaning rather than its exact
+    text, in a sqlite file.
+
+    A lookup first tries the normalized task text, which needs no embedding. Otherwise the
+    task is embedded and compared with every cached task of the same namespace; the most
+    similar one is a hit when its cosine similarity reaches `threshold`. Keep the threshold
+    high: tasks that differ in one important word ("villain masquerade" vs "classic
+    heroes") can still be close in embedding space.
+
+    Attributes:
+        stats (dict): exact_hits, semantic_hits, misses, stores and skipped (answers that
+            could not be cached) counters, and saved_seconds, the run time of the answers
+            served from the cache.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        embed: Callable[[str], np.ndarray],
+        threshold: float = 0.95,
+        ttl: float | None = None,
+        max_entries: int = 10_000,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "skipped": 0,
+            "saved_seconds": 0.0,
+        }
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, task_key TEXT NOT NULL,"
+            " task TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL,"
+            " run_seconds REAL NOT NULL, created_at REAL NOT NULL,"
+            " UNIQUE (namespace, task_key))"
+        )
+        self._conn.commit()
+        # namespace -> (ids, created_at, unit embeddings), loaded on first lookup
+        self._matrices: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        # Embeddings of recent tasks, so a miss isn't embedded again when it is stored
+        self._embeddings: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _embedding(self, task: str) -> np.ndarray:
+        key = _task_key(task)
+        with self._lock:
+            if key in self._embeddings:
+                return self._embeddings[key]
+        # Outside the lock, embedding is a network call
+        vector = np.asarray(self.embed(task), dtype=np.float32)
+        vector /= max(np.linalg.norm(vector), 1e-12)
+        with self._lock:
+            self._embeddings[key] = vector
+            if len(self._embeddings) > 256:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _matrix(self, namespace: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if namespace not in self._matrices:
+            rows = self._conn.execute(
+                "SELECT id, created_at, embedding FROM answers WHERE namespace = ?",
+                (namespace,),
+            ).fetchall()
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            created_at = np.array([row[1] for row in rows], dtype=np.float64)
+            embeddings = (
+                np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                if rows
+                else np.empty((0, 0), dtype=np.float32)
+            )
+            self._matrices[namespace] = (ids, created_at, embeddings)
+        return self._matrices[namespace]
+
+    def _hit(self, row, similarity: float, kind: str) -> AnswerHit:
+        task, answer, run_seconds = row
+        self.stats[kind] += 1
+        self.stats["saved_seconds"] += run_seconds
+        return AnswerHit(json.loads(answer), task, similarity, run_seconds)
+
+    def lookup(self, task: str, namespace: str = "") -> AnswerHit | None:
+        oldest = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task, answer, run_seconds FROM answers"
+                " WHERE namespace = ? AND task_key = ? AND created_at >= ?",
+                (namespace, _task_key(task), oldest),
+            ).fetchone()
+            if row is not None:
+                return self._hit(row, 1.0, "exact_hits")
+            if not len(self._matrix(namespace)[0]):
+                self.stats["misses"] += 1
+                return None
+
+        embedding = self._embedding(task)
+        with self._lock:
+            ids, created_at, embeddings = self._matrix(namespace)
+            if len(ids):
+                similarities = embeddings @ embedding
+                similarities[created_at < oldest] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self._conn.execute(
+                        "SELECT task, answer, run_seconds FROM answers WHERE id = ?",
+                        (int(ids[best]),),
+                    ).fetchone()
+                    if row is not None:
+                        return self._hit(
+                            row, float(similarities[best]), "semantic_hits"
+                        )
+            self.stats["misses"] += 1
+            return None
+
+    def put(
+        self, task: str, answer, namespace: str = "", run_seconds: float = 0.0
+    ) -> bool:
+        """Cache `answer` for `task`. Answers that aren't plain JSON values are skipped."""
+        if isinstance(answer, AgentType) and not isinstance(answer, str):
+            # Images and audio are files on disk, not something to replay later
+            self.stats["skipped"] += 1
+            return False
+        try:
+            payload = json.dumps(answer)
+        except TypeError:
+            self.stats["skipped"] += 1
+            return False
+
+        embedding = self._embedding(task)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (namespace, task_key, task, embedding, answer, run_seconds, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    namespace,
+                    _task_key(task),
+                    task,
+                    embedding.tobytes(),
+                    payload,
+                    run_seconds,
+                    now,
+                ),
+            )
+            if self.ttl is not None:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE created_at < ?", (now - self.ttl,)
+                )
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN"
+                " (SELECT id FROM answers ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._matrices.clear()
+            self.stats["stores"] += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+            self._matrices.clear()
+
+
+def _reached_max_steps(agent: MultiStepAgent) -> bool:
+    return any(
+        isinstance(getattr(step, "error", None), AgentMaxStepsError)
+        for step in agent.memory.steps
+    )
+
+
+def with_answer_cache(
+    agent: MultiStepAgent, cache: SemanticAnswerCache, fingerprint: bool = True
+) -> MultiStepAgent:
+    """
+    Answer `agent.run(task)` from `cache` when a near-identical task was answered before,
+    and cache the answers of the runs that do happen.
+
+    With `fingerprint`, answers are only shared between agents with the same tools,
+    managed agents and model. Streaming runs, runs continuing a conversation
+    (reset=False) and runs with images or additional_args always run. Answers the agent
+    gave up on after max_steps are not cached.
+    """
+    namespace = agent_fingerprint(agent) if fingerprint else ""
+    run = agent.run
+
+    def cached_run(
+        task: str,
+        stream: bool = False,
+        reset: bool = True,
+        images=None,
+        additional_args=None,
+        **kwargs,
+    ):
+        if stream or not reset or images or additional_args:
+            return run(task, stream, reset, images, additional_args, **kwargs)
+
+        hit = cache.lookup(task, namespace)
+        if hit is not None:
+            print(
+                f"Answer cache hit (similarity {hit.similarity:.3f}, "
+                f"saved {hit.run_seconds:.1f}s): {hit.task!r}"
+            )
+            return hit.answer
+
+        start = time.perf_counter()
+        answer = run(task, stream, reset, images, additional_args, **kwargs)
+        if not _reached_max_steps(agent):
+            cache.put(task, answer, namespace, time.perf_counter() - start)
+        return answer
+
+    agent.run = cached_run
+    agent.answer_cache = cache
+    return agent
@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import shutil
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+# Terms are stored in a fixed-width numpy string array so they can be memory-mapped
+MAX_TERM_LEN = 32
+
+
+def tokenize(text: str) -> list[str]:
+    return [token[:MAX_TERM_LEN] for token in TOKEN_RE.findall(text.lower())]
+
+
+class _Segment:
+    """
+    An immutable, memory-mapped slice of the index.
+
+    Files:
+        terms.npy: sorted vocabulary, looked up with np.searchsorted
+        term_offsets.npy: postings of terms[i] are doc_ids/tfs[term_offsets[i]:term_offsets[i + 1]]
+        doc_ids.npy, tfs.npy: postings, doc ids are local to the segment
+        doc_lens.npy: number of tokens per document
+        docs.jsonl, doc_offsets.npy: stored documents and their byte offsets
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.terms = np.load(path / "terms.npy", mmap_mode="r")
+        self.term_offsets = np.load(path / "term_offsets.npy", mmap_mode="r")
+        self.doc_ids = np.load(path / "doc_ids.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        self.doc_lens = np.load(path / "doc_lens.npy", mmap_mode="r")
+        self.doc_offsets = np.load(path / "doc_offsets.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.doc_lens)
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, end = self.term_offsets[i], self.term_offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def document(self, local_id: int) -> dict:
+        with open(self.path / "docs.jsonl", "rb") as f:
+            f.seek(int(self.doc_offsets[local_id]))
+            return json.loads(f.readline())
+
+    @classmethod
+    def write(cls, path: Path, docs: list[dict]) -> "_Segment":
+        # Built under a temporary name and renamed into place once complete. A directory
+        # already at `path` is an orphan, written by a run that crashed before meta.json
+        # listed it, and is replaced
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        for stale in (tmp_path, path):
+            shutil.rmtree(stale, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        postings = defaultdict(list)
+        doc_lens = np.empty(len(docs), dtype=np.int32)
+        doc_offsets = np.empty(len(docs), dtype=np.int64)
+        with open(tmp_path / "docs.jsonl", "wb") as f:
+            for doc_id, doc in enumerate(docs):
+                tokens = tokenize(doc["page_content"])
+                doc_lens[doc_id] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((doc_id, tf))
+
+                doc_offsets[doc_id] = f.tell()
+                f.write(json.dumps(doc, ensure_ascii=False).encode() + b"\n")
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = np.array(
+            [pair for term in terms for pair in postings[term]], dtype=np.int32
+        ).reshape(-1, 2)
+
+        np.save(tmp_path / "terms.npy", np.array(terms, dtype=f"<U{MAX_TERM_LEN}"))
+        np.save(tmp_path / "term_offsets.npy", term_offsets)
+        np.save(tmp_path / "doc_ids.npy", flat[:, 0])
+        np.save(tmp_path / "tfs.npy", flat[:, 1].astype(np.float32))
+        np.save(tmp_path / "doc_lens.npy", doc_lens)
+        np.save(tmp_path / "doc_offsets.npy", doc_offsets)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+
+class BM25Index:
+    """
+    An on-disk, append-only BM25 (Okapi) inverted index.
+
+    Every `add_documents` call writes a new immutable segment, so appending never rebuilds
+    what is already on disk. Segments are memory-mapped on open, which makes opening cheap
+    and lets several processes share the same pages.
+
+    Attributes:
+        path (Path): Directory holding `meta.json` and one sub-directory per segment.
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+    """
+
+    def __init__(self, path: str | os.PathLike, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+        else:
+            meta = {"k1": k1, "b": b, "segments": [], "total_len": 0}
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.total_len = meta["total_len"]
+        self.segments = [_Segment(self.path / name) for name in meta["segments"]]
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    @classmethod
+    def from_documents(cls, path: str | os.PathLike, docs, **kwargs) -> "BM25Index":
+        index = cls(path, **kwargs)
+        index.add_documents(docs)
+        return index
+
+    def add_documents(self, docs) -> None:
+        """
+        Append documents as a new segment. Accepts langchain Documents or dicts with `page_content`.
+        """
+        docs = [
+            doc
+            if isinstance(doc, dict)
+            else {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in docs
+        ]
+        if not docs:
+            return
+
+        segment = _Segment.write(self.path / f"seg_{len(self.segments):05d}", docs)
+        self.segments.append(segment)
+        self.total_len += int(segment.doc_lens.sum())
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        meta = {
+            "k1": self.k1,
+            "b": self.b,
+            "segments": [segment.path.name for segment in self.segments],
+            "total_len": self.total_len,
+        }
+        # Write then rename, so readers never see a half-written meta.json
+        tmp_path = self.path / "meta.json.tmp"
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self.path / "meta.json")
+
+    def search(self, query: str, k: int = 5) -> list[tuple[int, float]]:
+        """
+        Return the top `k` (doc_id, score) pairs for `query`, best first.
+        """
+        n_docs = len(self)
+        terms = set(tokenize(query))
+        if not n_docs or not terms:
+            return []
+
+        # Corpus-wide statistics, so scores are comparable across segments
+        avg_len = self.total_len / n_docs
+        postings = [
+            {term: segment.postings(term) for term in terms}
+            for segment in self.segments
+        ]
+        df = {
+            term: sum(len(segment_postings[term][0]) for segment_postings in postings)
+            for term in terms
+        }
+        idf = {
+            term: np.log1p((n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            for term in terms
+        }
+
+        candidate_ids, candidate_scores = [], []
+        base = 0
+        for segment, segment_postings in zip(self.segments, postings):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            for term, (doc_ids, tfs) in segment_postings.items():
+                if not len(doc_ids):
+                    continue
+                norm = self.k1 * (
+                    1 - self.b + self.b * segment.doc_lens[doc_ids] / avg_len
+                )
+                # Doc ids are unique within one term's postings, so fancy += is safe
+                scores[doc_ids] += idf[term] * tfs * (self.k1 + 1) / (tfs + norm)
+
+            top = _top_k(scores, k)
+            candidate_ids.append(top + base)
+            candidate_scores.append(scores[top])
+            base += len(segment)
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        top = _top_k(scores, k)
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def get_document(self, doc_id: int) -> dict:
+        local_id = doc_id
+        for segment in self.segments:
+            if local_id < len(segment):
+                return segment.document(local_id)
+            local_id -= len(segment)
+        raise IndexError(f"Document {doc_id} is out of range")
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` largest positive scores, highest first."""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+
+@dataclass
+class IngestionStats:
+    documents: int = 0
+    nodes: int = 0
+    embed_batches: int = 0
+    writes: int = 0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+def _batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+async def ingest_concurrently(
+    documents,
+    transformations: list[TransformComponent],
+    embed_model: BaseEmbedding,
+    vector_store: BasePydanticVectorStore,
+    embed_batch_size: int = 64,
+    max_concurrent_embeds: int = 8,
+    write_batch_size: int = 1024,
+    queue_size: int = 16,
+    document_batch_size: int = 256,
+) -> IngestionStats:
+    """
+    Split, embed and write documents as three overlapping stages.
+
+    - Documents are split `document_batch_size` at a time with `transformations`.
+    - Up to `max_concurrent_embeds` embedding requests of `embed_batch_size` nodes are in flight.
+    - A single writer flushes embedded nodes to `vector_store` in `write_batch_size` chunks
+      while later batches are still embedding.
+
+    Embedded batches wait in a queue of `queue_size` batches; when the writer falls behind
+    the queue fills up and no new embedding requests are started, so memory stays flat.
+
+    `documents` can be any iterable, including a generator of already split nodes (see
+    common.streaming_loader) with no `transformations`; it is consumed off the event loop.
+    """
+    stats = IngestionStats()
+    queue: asyncio.Queue[list[BaseNode] | None] = asyncio.Queue(maxsize=queue_size)
+    in_flight = asyncio.Semaphore(max_concurrent_embeds)
+
+    document_batches = _batched(documents, document_batch_size)
+
+    def next_split_batch() -> tuple[int, list[BaseNode]] | None:
+        """Pull and split the next batch, in a thread since pulling can block."""
+        batch = next(document_batches, None)
+        if batch is None:
+            return None
+        nodes = batch
+        for transform in transformations:
+            nodes = transform(nodes)
+        return len(batch), nodes
+
+    async def embed(nodes: list[BaseNode]) -> None:
+        try:
+            start = time.perf_counter()
+            embeddings = await embed_model.aget_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            )
+            stats.embed_seconds += time.perf_counter() - start
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+            stats.embed_batches += 1
+            await queue.put(nodes)
+        finally:
+            in_flight.release()
+
+    async def pull() -> tuple[int, list[BaseNode]] | None:
+        pulling = asyncio.ensure_future(asyncio.to_thread(next_split_batch))
+        try:
+            return await asyncio.shield(pulling)
+        except asyncio.CancelledError:
+            # The thread can't be stopped, wait for it so `documents` is idle by the time
+            # we return and the caller can close it
+            await asyncio.wait([pulling])
+            raise
+
+    async def produce() -> None:
+        # A failed embedding request cancels the others and fails the producer
+        async with asyncio.TaskGroup() as embeds:
+            while (split_batch := await pull()) is not None:
+                n_documents, nodes = split_batch
+                stats.documents += n_documents
+                stats.nodes += len(nodes)
+                for batch in _batched(nodes, embed_batch_size):
+                    await in_flight.acquire()
+                    embeds.create_task(embed(batch))
+        await queue.put(None)
+
+    async def flush(buffer: list[BaseNode]) -> None:
+        start = time.perf_counter()
+        # Chroma's client is synchronous, run it off the loop so embedding keeps going
+        await asyncio.to_thread(vector_store.add, buffer)
+        stats.write_seconds += time.perf_counter() - start
+        stats.writes += 1
+
+    async def write() -> None:
+        buffer = []
+        while (nodes := await queue.get()) is not None:
+            buffer.extend(nodes)
+            if len(buffer) >= write_batch_size:
+                await flush(buffer)
+                buffer = []
+        if buffer:
+            await flush(buffer)
+
+    try:
+        # If either stage fails the other is cancelled, so nothing keeps embedding into
+        # a queue nobody reads, or waits on a producer that is gone
+        async with asyncio.TaskGroup() as stages:
+            stages.create_task(produce())
+            stages.create_task(write())
+    except BaseExceptionGroup as group:
+        error = group
+        while isinstance(error, BaseExceptionGroup):
+            error = error.exceptions[0]
+        raise error from group
+    stats.elapsed_seconds = time.perf_counter() - stats.started_at
+    return stats
@@ -0,0 +1,198 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+
+class EmbeddingCache:
+    """
+    A disk-backed, size-bounded LRU cache of embeddings keyed on (model name, text hash).
+
+    Attributes:
+        path (Path): The sqlite file holding the cache.
+        max_bytes (int): Least recently used entries are evicted once stored vectors exceed this size.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that had to be embedded.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 1 << 30):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+        }
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """
+        Return the cached vectors for `keys`, missing keys are left out.
+        """
+        found = {}
+        with self._lock:
+            # Stay below sqlite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((key, array("f", vector).tolist()) for key, vector in rows)
+
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, vector in items.items():
+                blob = array("f", vector).tobytes()
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now),
+                ).rowcount
+                self._total_bytes += len(blob) if inserted else 0
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+
+            evicted, freed = [], 0
+            for key, size in rows:
+                evicted.append((key,))
+                freed += size
+                if self._total_bytes - freed <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self._total_bytes -= freed
+            self.evictions += len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._total_bytes = 0
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps any LlamaIndex embedding model so unchanged chunks are never embedded twice.
+    Drop it into an IngestionPipeline in place of the wrapped model.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        kwargs.setdefault("model_name", embed_model.model_name)
+        kwargs.setdefault("embed_batch_size", embed_model.embed_batch_size)
+        super().__init__(**kwargs)
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _split(self, texts: list[str]) -> tuple[list[str], dict, list[str]]:
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        cached = self._cache.get_many(keys)
+        # Duplicates inside one batch are embedded once
+        missing = list(
+            dict.fromkeys(text for key, text in zip(keys, texts) if key not in cached)
+        )
+        return keys, cached, missing
+
+    def _merge(
+        self, keys: list[str], cached: dict, missing: list[str], embeddings
+    ) -> list[Embedding]:
+        computed = {
+            EmbeddingCache.key(self.model_name, text): embedding
+            for text, embedding in zip(missing, embeddings)
+        }
+        if computed:
+            self._cache.put_many(computed)
+        return [cached[key] if key in cached else computed[key] for key in keys]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._split(texts)
+        embeddings = (
+            self._embed_model.get_text_embedding_batch(missing) if missing else []
+        )
+        return self._merge(keys, cached, missing, embeddings)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._split(texts)
+        embeddings = (
+            await self._embed_model.aget_text_embedding_batch(missing)
+            if missing
+            else []
+        )
+        return self._merge(keys, cached, missing, embeddings)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    # Queries are short-lived and embedded with a query instruction, so they skip the cache
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
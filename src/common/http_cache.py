@@ -0,0 +1,415 @@
+import codecs
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from smolagents import Tool, VisitWebpageTool
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status_code: int
+    headers: dict
+    content: bytes
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        charset = re.search(r"charset=([\w-]+)", self.headers.get("Content-Type", ""))
+        encoding = "utf-8"
+        if charset:
+            try:
+                encoding = codecs.lookup(charset.group(1)).name
+            except LookupError:
+                pass  # A charset Python does not know, read it as utf-8
+        return self.content.decode(encoding, "replace")
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+@dataclass
+class _Entry:
+    stored_at: float
+    ttl: float
+    value: CachedResponse | str
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        value = self.value
+        self.size = (
+            len(value.content) if isinstance(value, CachedResponse) else len(value)
+        )
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.stored_at < self.ttl
+
+
+class SharedFetchCache:
+    """
+    A fetch layer shared by the web tools of every agent in the process.
+
+    - `get` fetches a URL: fresh responses are served from cache, stale ones are revalidated
+      with their ETag / Last-Modified, and `Cache-Control: max-age` / `no-store` are honored.
+    - `call` memoizes any string-returning call (e.g. a search query) with the same tiers.
+    Entries live in a bounded in-memory LRU backed by a disk tier, and concurrent identical
+    requests are collapsed into a single in-flight fetch. The disk tier is bounded too:
+    past `max_disk_bytes` or `max_disk_entries`, the least recently used entries are
+    deleted until it is back under 90% of both.
+
+    Attributes:
+        stats (dict): memory_hits, disk_hits, revalidated, misses, collapsed and
+            disk_evictions counters.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = "./.http_cache",
+        default_ttl: float = 300.0,
+        max_memory_entries: int = 1024,
+        max_memory_bytes: int = 64 << 20,
+        max_disk_entries: int = 100_000,
+        max_disk_bytes: int = 1 << 30,
+        pool_size: int = 32,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.default_ttl = default_ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = dict.fromkeys(
+            (
+                "memory_hits",
+                "disk_hits",
+                "revalidated",
+                "misses",
+                "collapsed",
+                "disk_evictions",
+            ),
+            0,
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        self._memory_bytes = 0
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._disk_entries, self._disk_bytes = self._disk_usage()
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        hits += self.stats["revalidated"] + self.stats["collapsed"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.cache_dir / f"{digest}.json", self.cache_dir / f"{digest}.bin"
+
+    def _disk_files(self) -> list[tuple[float, Path, Path, int]]:
+        """(last used, meta path, body path, bytes) of every entry on disk."""
+        files = []
+        for meta_path in self.cache_dir.glob("*.json"):
+            body_path = meta_path.with_suffix(".bin")
+            try:
+                stat = meta_path.stat()
+                size = stat.st_size
+                if body_path.exists():
+                    size += body_path.stat().st_size
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, meta_path, body_path, size))
+        return files
+
+    def _disk_usage(self) -> tuple[int, int]:
+        files = self._disk_files()
+        return len(files), sum(size for *_, size in files)
+
+    def _evict_disk(self) -> None:
+        """Delete the least recently used entries until the disk tier is under 90%."""
+        if not self._evict_lock.acquire(blocking=False):
+            return  # Another thread is already at it
+        try:
+            files = sorted(self._disk_files())
+            entries, total = len(files), sum(size for *_, size in files)
+            evicted = 0
+            for _, meta_path, body_path, size in files:
+                if (
+                    entries <= 0.9 * self.max_disk_entries
+                    and total <= 0.9 * self.max_disk_bytes
+                ):
+                    break
+                # Metadata first, an entry without it is never read
+                meta_path.unlink(missing_ok=True)
+                body_path.unlink(missing_ok=True)
+                entries -= 1
+                total -= size
+                evicted += 1
+            with self._lock:
+                self._disk_entries, self._disk_bytes = entries, total
+                self.stats["disk_evictions"] += evicted
+        finally:
+            self._evict_lock.release()
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        with self._lock:
+            if (old := self._memory.pop(key, None)) is not None:
+                self._memory_bytes -= old.size
+            self._memory[key] = entry
+            self._memory_bytes += entry.size
+            while self._memory and (
+                len(self._memory) > self.max_memory_entries
+                or self._memory_bytes > self.max_memory_bytes
+            ):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size
+
+    def _lookup(self, key: str) -> tuple[_Entry | None, str | None]:
+        """
+        Return the entry for `key` and the tier it came from ("memory" or "disk").
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "memory"
+
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta["kind"] == "http":
+                value = CachedResponse(
+                    url=meta["url"],
+                    status_code=meta["status_code"],
+                    headers=meta["headers"],
+                    content=body_path.read_bytes(),
+                )
+            else:
+                value = meta["value"]
+            # Marks the entry as recently used for disk eviction
+            meta_path.touch()
+        except FileNotFoundError:
+            # Not cached, or evicted while being read
+            return None, None
+        entry = _Entry(stored_at=meta["stored_at"], ttl=meta["ttl"], value=value)
+        self._remember(key, entry)
+        return entry, "disk"
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        self._remember(key, entry)
+        meta_path, body_path = self._paths(key)
+        replaced = [
+            path.stat().st_size for path in (meta_path, body_path) if path.exists()
+        ]
+        meta = {"key": key, "stored_at": entry.stored_at, "ttl": entry.ttl}
+        if isinstance(entry.value, CachedResponse):
+            response = entry.value
+            meta.update(
+                kind="http",
+                url=response.url,
+                status_code=response.status_code,
+                headers=response.headers,
+            )
+            tmp_path = body_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(response.content)
+            tmp_path.replace(body_path)
+        else:
+            meta.update(kind="value", value=entry.value)
+        # Metadata last, so a half-written entry is never picked up
+        tmp_path = meta_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        tmp_path.replace(meta_path)
+
+        size = meta_path.stat().st_size + (
+            len(entry.value.content) if isinstance(entry.value, CachedResponse) else 0
+        )
+        with self._lock:
+            self._disk_entries += 0 if replaced else 1
+            self._disk_bytes += size - sum(replaced)
+            over = (
+                self._disk_entries > self.max_disk_entries
+                or self._disk_bytes > self.max_disk_bytes
+            )
+        if over:
+            self._evict_disk()
+
+    def _single_flight(self, key: str, fetch):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            self._count("collapsed")
+            return future.result()
+
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _ttl(self, headers) -> float | None:
+        """Seconds a response stays fresh, None if it must not be stored."""
+        cache_control = headers.get("Cache-Control", "")
+        if "no-store" in cache_control:
+            return None
+        if match := MAX_AGE_RE.search(cache_control):
+            return float(match.group(1))
+        return self.default_ttl
+
+    def get(
+        self, url: str, params: dict | None = None, timeout: float = 20.0
+    ) -> CachedResponse:
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        key = f"GET {full_url}"
+        return self._single_flight(key, lambda: self._get(key, full_url, timeout))
+
+    def _get(self, key: str, url: str, timeout: float) -> CachedResponse:
+        entry, tier = self._lookup(key)
+        if entry is not None and entry.fresh:
+            self._count(f"{tier}_hits")
+            return CachedResponse(**{**entry.value.__dict__, "from_cache": True})
+
+        headers = {}
+        if entry is not None:
+            if etag := entry.value.headers.get("ETag"):
+                headers["If-None-Match"] = etag
+            if last_modified := entry.value.headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            ttl = self._ttl(response.headers) or entry.ttl
+            self._store(key, _Entry(stored_at=time.time(), ttl=ttl, value=entry.value))
+            return CachedResponse(**{**entry.value.__dict__, "from_cache": True})
+
+        self._count("misses")
+        cached = CachedResponse(
+            url=response.url,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=response.content,
+        )
+        ttl = self._ttl(response.headers)
+        if response.status_code == 200 and ttl is not None:
+            self._store(key, _Entry(stored_at=time.time(), ttl=ttl, value=cached))
+        return cached
+
+    def call(self, key: str, fetch, ttl: float | None = None) -> str:
+        """
+        Return `fetch()`, a string, memoized under `key` for `ttl` seconds.
+        """
+        key = f"CALL {key}"
+
+        def load() -> str:
+            entry, tier = self._lookup(key)
+            if entry is not None and entry.fresh:
+                self._count(f"{tier}_hits")
+                return entry.value
+
+            self._count("misses")
+            value = fetch()
+            self._store(
+                key,
+                _Entry(
+                    stored_at=time.time(),
+                    ttl=self.default_ttl if ttl is None else ttl,
+                    value=value,
+                ),
+            )
+            return value
+
+        return self._single_flight(key, load)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_fetch_cache() -> SharedFetchCache:
+    """The process-wide cache used by the cached web tools by default."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SharedFetchCache()
+        return _shared_cache
+
+
+class CachedVisitWebpageTool(VisitWebpageTool):
+    """VisitWebpageTool routed through the shared fetch cache."""
+
+    def __init__(self, cache: SharedFetchCache | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache or shared_fetch_cache()
+
+    def forward(self, url: str) -> str:
+        from markdownify import markdownify
+        from smolagents.utils import truncate_content
+
+        try:
+            response = self.cache.get(url, timeout=20)
+            response.raise_for_status()
+            markdown_content = markdownify(response.text).strip()
+            markdown_content = re.sub(r"\n{3,}", "\n\n", markdown_content)
+            return truncate_content(markdown_content, 10000)
+        except requests.exceptions.Timeout:
+            return "The request timed out. Please try again later or check the URL."
+        except requests.RequestException as e:
+            return f"Error fetching the webpage: {e}"
+        except (OSError, ValueError) as e:
+            # Reading the disk cache or decoding the page
+            return f"An unexpected error occurred: {e}"
+
+
+def with_shared_cache(
+    tool: Tool, cache: SharedFetchCache | None = None, ttl: float | None = None
+) -> Tool:
+    """
+    Memoize a search tool's results per query through the shared fetch cache,
+    for tools like DuckDuckGoSearchTool and GoogleSearchTool.
+    """
+    cache = cache or shared_fetch_cache()
+    forward = tool.forward
+
+    def cached_forward(*args, **kwargs):
+        key = f"{tool.name} {json.dumps([args, kwargs], sort_keys=True, default=str)}"
+        return cache.call(key, lambda: forward(*args, **kwargs), ttl=ttl)
+
+    tool.forward = cached_forward
+    return tool
@@ -0,0 +1,394 @@
+import copy
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from smolagents import CodeAgent, MultiStepAgent, Tool
+
+
+def _files(folder: Path) -> list[Path]:
+    """The files of an agent folder, without download metadata and bytecode."""
+    return sorted(
+        path
+        for path in folder.rglob("*")
+        if path.is_file()
+        and not any(
+            part.startswith(".") or part == "__pycache__"
+            for part in path.relative_to(folder).parts
+        )
+    )
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tree_sha256(folder: str | Path) -> str:
+    """A hash of the relative paths and contents of the files under `folder`."""
+    folder = Path(folder)
+    digest = hashlib.sha256()
+    for path in _files(folder):
+        digest.update(f"{path.relative_to(folder).as_posix()}\0".encode())
+        digest.update(f"{_file_sha256(path)}\0".encode())
+    return digest.hexdigest()
+
+
+class HfHubSource:
+    """Agents pushed to Spaces on the Hugging Face Hub, where push_to_hub puts them."""
+
+    def __init__(self, token: str | None = None, repo_type: str = "space"):
+        self.token = token or None
+        self.repo_type = repo_type
+
+    def resolve(self, repo_id: str, revision: str | None = None) -> str:
+        """The commit hash `revision` (a branch, tag or commit, default main) points to."""
+        from huggingface_hub import HfApi
+
+        info = HfApi(token=self.token).repo_info(
+            repo_id, repo_type=self.repo_type, revision=revision
+        )
+        return info.sha
+
+    def download(self, repo_id: str, revision: str, dest: Path) -> None:
+        from huggingface_hub import snapshot_download
+
+        snapshot_download(
+            repo_id,
+            repo_type=self.repo_type,
+            revision=revision,
+            token=self.token,
+            local_dir=dest,
+        )
+
+    def push(self, agent: MultiStepAgent, repo_id: str) -> None:
+        agent.push_to_hub(repo_id, token=self.token)
+
+
+class LocalHubSource:
+    """
+    A directory standing in for the hub: `root/<repo_id>/` holds the folder push_to_hub
+    would upload. A repo has one revision, the hash of its content.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def resolve(self, repo_id: str, revision: str | None = None) -> str:
+        folder = self.root / repo_id
+        if not (folder / "agent.json").is_file():
+            raise FileNotFoundError(f"No agent at {folder}")
+        sha = tree_sha256(folder)
+        if revision not in (None, "main", sha):
+            raise FileNotFoundError(f"{repo_id} is at {sha}, not {revision}")
+        return sha
+
+    def download(self, repo_id: str, revision: str, dest: Path) -> None:
+        shutil.copytree(self.root / repo_id, dest, dirs_exist_ok=True)
+
+    def push(self, agent: MultiStepAgent, repo_id: str) -> None:
+        folder = self.root / repo_id
+        tmp = folder.with_name(f".{folder.name}.{uuid.uuid4().hex}")
+        agent.save(str(tmp))
+        # Replace the whole folder, so files of tools the agent no longer has go away
+        old = folder.with_name(f".{folder.name}.{uuid.uuid4().hex}.old")
+        if folder.exists():
+            folder.rename(old)
+        tmp.rename(folder)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+@dataclass
+class _Ref:
+    sha: str
+    resolved_at: float
+
+
+class AgentArtifactCache:
+    """
+    Local copies of agent repos, usable offline once fetched.
+
+    Layout under `root`:
+        objects/ab/<sha256>       file contents, stored once however many revisions share them
+        snapshots/<revision>/     a revision's folder, hard links into objects/
+        refs.sqlite               which revision each (repo, branch or tag) resolved to
+
+    A revision (the hub's commit hash) never changes, so a snapshot is fetched once. Asking
+    for a branch resolves it against the source, unless it was resolved less than
+    `ref_ttl` seconds ago. With `offline`, or when the source can't be reached, the last
+    resolved revision is used.
+
+    Attributes:
+        stats (dict): hits (no source call), resolves, offline_hits (source unreachable,
+            served from the cache), downloads, bytes_downloaded and bytes_deduplicated
+            (downloaded files that were already in objects/).
+    """
+
+    def __init__(
+        self,
+        root: str | Path = "./.hub_cache",
+        source: HfHubSource | LocalHubSource | None = None,
+        ref_ttl: float = 300.0,
+        offline: bool = False,
+    ):
+        self.root = Path(root)
+        self.source = source or HfHubSource()
+        self.ref_ttl = ref_ttl
+        self.offline = offline
+        self.stats = {
+            "hits": 0,
+            "resolves": 0,
+            "offline_hits": 0,
+            "downloads": 0,
+            "bytes_downloaded": 0,
+            "bytes_deduplicated": 0,
+        }
+        for name in ("objects", "snapshots", "tmp"):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.root / "refs.sqlite", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs (repo_id TEXT NOT NULL, ref TEXT NOT NULL,"
+            " sha TEXT NOT NULL, resolved_at REAL NOT NULL, PRIMARY KEY (repo_id, ref))"
+        )
+        self._conn.commit()
+        self._refs = {
+            (repo_id, ref): _Ref(sha, resolved_at)
+            for repo_id, ref, sha, resolved_at in self._conn.execute(
+                "SELECT repo_id, ref, sha, resolved_at FROM refs"
+            )
+        }
+
+    def _snapshot_path(self, sha: str) -> Path:
+        return self.root / "snapshots" / sha
+
+    def _record_ref(self, repo_id: str, ref: str, sha: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._refs[repo_id, ref] = _Ref(sha, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)",
+                (repo_id, ref, sha, now),
+            )
+
+    def invalidate(self, repo_id: str) -> None:
+        """Resolve the repo's branches again on next use, e.g. after pushing to it."""
+        with self._lock, self._conn:
+            # Marked stale rather than forgotten, still good as an offline fallback
+            for key, known in self._refs.items():
+                if key[0] == repo_id:
+                    known.resolved_at = 0.0
+            self._conn.execute(
+                "UPDATE refs SET resolved_at = 0 WHERE repo_id = ?", (repo_id,)
+            )
+
+    def snapshot(self, repo_id: str, revision: str | None = None) -> Path:
+        """The local folder of `repo_id` at `revision`, fetched if it isn't cached yet."""
+        ref = revision or "main"
+        if self._snapshot_path(ref).is_dir():
+            # Asked for a revision hash that is already here
+            self.stats["hits"] += 1
+            return self._snapshot_path(ref)
+
+        with self._lock:
+            known = self._refs.get((repo_id, ref))
+        cached = known is not None and self._snapshot_path(known.sha).is_dir()
+        if cached and (self.offline or time.time() - known.resolved_at < self.ref_ttl):
+            self.stats["hits"] += 1
+            return self._snapshot_path(known.sha)
+        if self.offline:
+            raise FileNotFoundError(f"{repo_id}@{ref} is not cached and offline is set")
+
+        try:
+            sha = self.source.resolve(repo_id, revision)
+        except OSError as e:
+            # Unreachable hub (connection errors and HTTP errors are OSErrors too)
+            if not cached:
+                raise
+            print(f"Could not resolve {repo_id}@{ref} ({e}), using {known.sha[:12]}")
+            self.stats["offline_hits"] += 1
+            return self._snapshot_path(known.sha)
+        self.stats["resolves"] += 1
+
+        if not self._snapshot_path(sha).is_dir():
+            self._fetch(repo_id, sha)
+        self._record_ref(repo_id, ref, sha)
+        return self._snapshot_path(sha)
+
+    def _store(self, path: Path) -> Path:
+        """Move `path` into objects/ unless its content is already there."""
+        sha = _file_sha256(path)
+        obj = self.root / "objects" / sha[:2] / sha
+        if obj.exists():
+            self.stats["bytes_deduplicated"] += path.stat().st_size
+        else:
+            obj.parent.mkdir(exist_ok=True)
+            os.replace(path, obj)
+        return obj
+
+    def _fetch(self, repo_id: str, sha: str) -> None:
+        tmp = self.root / "tmp" / uuid.uuid4().hex
+        download, tree = tmp / "download", tmp / "tree"
+        try:
+            self.source.download(repo_id, sha, download)
+            self.stats["downloads"] += 1
+            for path in _files(download):
+                self.stats["bytes_downloaded"] += path.stat().st_size
+                target = tree / path.relative_to(download)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                obj = self._store(path)
+                try:
+                    os.link(obj, target)
+                except OSError:
+                    shutil.copyfile(obj, target)
+            # Published in one rename, a snapshot folder that exists is complete
+            try:
+                tree.rename(self._snapshot_path(sha))
+            except OSError:
+                if not self._snapshot_path(sha).is_dir():
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+@dataclass
+class _AgentTemplate:
+    agent_cls: type[MultiStepAgent]
+    agent_dict: dict
+    # The classes defined by the repo's tool files, each build gets its own instances
+    tool_classes: list[type[Tool]]
+    managed_agents: list["_AgentTemplate"]
+
+    @classmethod
+    def load(cls, agent_cls: type[MultiStepAgent], folder: Path) -> "_AgentTemplate":
+        """What MultiStepAgent.from_folder reads, with the tools' code already run."""
+        agent_dict = json.loads((folder / "agent.json").read_text())
+        managed_agents = [
+            cls.load(
+                getattr(importlib.import_module("smolagents.agents"), class_name),
+                folder / "managed_agents" / name,
+            )
+            for name, class_name in agent_dict["managed_agents"].items()
+        ]
+        tool_classes = [
+            type(Tool.from_code((folder / "tools" / f"{name}.py").read_text()))
+            for name in agent_dict["tools"]
+        ]
+        return cls(agent_cls, agent_dict, tool_classes, managed_agents)
+
+    def build(self, **kwargs) -> MultiStepAgent:
+        agent_dict = self.agent_dict
+        if "model" not in kwargs:
+            model_class = getattr(
+                importlib.import_module("smolagents.models"),
+                agent_dict["model"]["class"],
+            )
+            kwargs["model"] = model_class.from_dict(agent_dict["model"]["data"])
+        args = {
+            "tools": [tool_cls() for tool_cls in self.tool_classes],
+            "managed_agents": [managed.build() for managed in self.managed_agents],
+            "name": agent_dict["name"],
+            "description": agent_dict["description"],
+            "max_steps": agent_dict["max_steps"],
+            "planning_interval": agent_dict["planning_interval"],
+            "grammar": agent_dict["grammar"],
+            "verbosity_level": agent_dict["verbosity_level"],
+        }
+        if "prompt_templates" in agent_dict:
+            # The agent's own templates, and the agent class doesn't parse its yaml again
+            args["prompt_templates"] = copy.deepcopy(agent_dict["prompt_templates"])
+        if issubclass(self.agent_cls, CodeAgent):
+            args["additional_authorized_imports"] = agent_dict["authorized_imports"]
+        args.update(kwargs)
+        return self.agent_cls(**args)
+
+
+class HubAgentPool:
+    """
+    Agents from the hub, loaded once per repo revision and handed out as new instances.
+
+    The first `get` of a revision fetches it through `cache` and runs its tools' code,
+    the slow part of `from_hub`. Every `get` then builds a fresh agent with new instances
+    of those tool classes: its own tools, memory, state, executor and model, so nothing
+    one caller does to an agent reaches the next.
+
+    Once a branch was resolved, a `get` within the cache's `ref_ttl` makes no hub call.
+
+    Usage:
+        pool = HubAgentPool(AgentArtifactCache("./.hub_cache"))
+        agent = pool.get("user/AlfredAgent", trust_remote_code=True, model=model)
+    """
+
+    def __init__(self, cache: AgentArtifactCache):
+        self.cache = cache
+        self.stats = {"warm_gets": 0, "loads": 0, "load_seconds": 0.0}
+        self._lock = threading.Lock()
+        # (agent class, repo) -> the revision folder loaded and its template
+        self._templates: dict[tuple[type, str], tuple[Path, _AgentTemplate]] = {}
+
+    def _template(
+        self, agent_cls: type[MultiStepAgent], repo_id: str, revision: str | None
+    ) -> _AgentTemplate:
+        folder = self.cache.snapshot(repo_id, revision)
+        with self._lock:
+            loaded = self._templates.get((agent_cls, repo_id))
+            if loaded is not None and loaded[0] == folder:
+                self.stats["warm_gets"] += 1
+                return loaded[1]
+            # Not loaded yet, or the repo moved to another revision
+            start = time.perf_counter()
+            template = _AgentTemplate.load(agent_cls, folder)
+            self._templates[agent_cls, repo_id] = (folder, template)
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += time.perf_counter() - start
+            return template
+
+    def get(
+        self,
+        repo_id: str,
+        revision: str | None = None,
+        trust_remote_code: bool = False,
+        agent_cls: type[MultiStepAgent] = CodeAgent,
+        **kwargs,
+    ) -> MultiStepAgent:
+        """
+        A new agent from `repo_id`, like `agent_cls.from_hub(repo_id, ...)`. `kwargs` are
+        passed to the agent's init.
+        """
+        if not trust_remote_code:
+            raise ValueError(
+                "Loading an agent from Hub requires to acknowledge you trust its code: "
+                "to do so, pass `trust_remote_code=True`."
+            )
+        return self._template(agent_cls, repo_id, revision).build(**kwargs)
+
+    def warm(
+        self,
+        repo_id: str,
+        revision: str | None = None,
+        agent_cls: type[MultiStepAgent] = CodeAgent,
+    ) -> None:
+        """Fetch and load a revision ahead of the first `get`."""
+        self._template(agent_cls, repo_id, revision)
+
+    def push(self, agent: MultiStepAgent, repo_id: str) -> None:
+        """Publish `agent` to the cache's source, the next `get` loads the new revision."""
+        self.cache.source.push(agent, repo_id)
+        self.cache.invalidate(repo_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
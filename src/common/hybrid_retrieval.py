@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic
+from typing import ClassVar
+
+import numpy as np
+from smolagents import Tool
+
+from common.bm25_index import BM25Index
+
+# Constant from the original RRF paper, dampens the weight of the very top ranks
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[list[str]]], k: int = 5, rrf_k: int = RRF_K
+) -> list[list[str]]:
+    """
+    Fuse ranked lists with reciprocal-rank fusion, score(d) = sum over backends of 1 / (rrf_k + rank).
+
+    Args:
+        rankings: rankings[backend][query] is that backend's ranked list of document keys.
+        k: Number of fused results to keep per query.
+    Returns:
+        The top `k` document keys per query, best first.
+    """
+    n_queries = len(rankings[0]) if rankings else 0
+    query_idx, ranks, keys = [], [], []
+    for backend in rankings:
+        for q, ranked in enumerate(backend):
+            query_idx.extend([q] * len(ranked))
+            ranks.extend(range(1, len(ranked) + 1))
+            keys.extend(ranked)
+    if not keys:
+        return [[] for _ in range(n_queries)]
+
+    # Score every (query, document) cell of a dense matrix in one bincount
+    vocabulary, doc_idx = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    cells = np.asarray(query_idx) * len(vocabulary) + doc_idx
+    scores = np.bincount(
+        cells,
+        weights=1.0 / (rrf_k + np.asarray(ranks, dtype=np.float64)),
+        minlength=n_queries * len(vocabulary),
+    ).reshape(n_queries, len(vocabulary))
+
+    k = min(k, len(vocabulary))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    top = np.take_along_axis(top, np.argsort(-top_scores, axis=1, kind="stable"), 1)
+    return [
+        [vocabulary[i] for i in row if scores[q, i] > 0] for q, row in enumerate(top)
+    ]
+
+
+class HybridRetrieverTool(Tool):
+    """
+    Queries the on-disk BM25 index and a LlamaIndex vector store in parallel and fuses
+    both rankings with reciprocal-rank fusion. Documents are matched across the two
+    backends by their text.
+
+    Each backend gets its own timeout: a backend that has not answered by then is left
+    out of the fusion for that call rather than stalling the agent's step. Each backend
+    runs on its own `max_workers` threads, so queries a slow backend is still working on
+    after its timeout do not hold up the other backend on later calls. A backend that
+    fails is left out too and the error is printed; when no backend answers a query and
+    one of them failed, the error is raised.
+
+    Attributes:
+        timed_out (dict): per backend, queries it did not answer in time.
+        failed (dict): per backend, queries it raised on.
+    """
+
+    name = "hybrid_retriever"
+    description = (
+        "Retrieves party planning ideas for Alfred’s superhero-themed party at Wayne Manor, "
+        "combining keyword and semantic search. Takes a list of queries and answers all of "
+        "them in one call, so pass every query at once instead of calling it in a loop."
+    )
+    inputs: ClassVar[dict] = {
+        "queries": {
+            "type": "array",
+            "description": "The queries to perform, related to party planning or superhero themes.",
+        }
+    }
+    output_type = "string"
+
+    def __init__(
+        self,
+        bm25_index: BM25Index,
+        vector_store,
+        embed_model,
+        k: int = 5,
+        candidates: int = 20,
+        bm25_timeout: float = 2.0,
+        vector_timeout: float = 10.0,
+        max_workers: int = 8,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.bm25_index = bm25_index
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.k = k
+        self.candidates = candidates
+        self.timeouts = {"bm25": bm25_timeout, "vector": vector_timeout}
+        self.timed_out = {"bm25": 0, "vector": 0}
+        self.failed = {"bm25": 0, "vector": 0}
+        # One pool per backend: running futures cannot be cancelled, so the threads of a
+        # backend that timed out stay busy, and must not hold up the other backend
+        self._executors = {
+            backend: ThreadPoolExecutor(
+                max_workers, thread_name_prefix=f"{self.name}-{backend}"
+            )
+            for backend in self.timeouts
+        }
+
+    def _bm25_search(self, query: str) -> list[str]:
+        return [
+            self.bm25_index.get_document(doc_id)["page_content"]
+            for doc_id, _ in self.bm25_index.search(query, k=self.candidates)
+        ]
+
+    def _vector_search(self, query: str) -> list[str]:
+        from llama_index.core.vector_stores.types import VectorStoreQuery
+
+        result = self.vector_store.query(
+            VectorStoreQuery(
+                query_embedding=self.embed_model.get_query_embedding(query),
+                similarity_top_k=self.candidates,
+            )
+        )
+        return [node.get_content() for node in result.nodes or []]
+
+    def search(self, queries: list[str]) -> list[list[str]]:
+        """Return the fused top `k` texts for each query."""
+        start = monotonic()
+        searches = {"bm25": self._bm25_search, "vector": self._vector_search}
+        futures = {
+            backend: [self._executors[backend].submit(search, q) for q in queries]
+            for backend, search in searches.items()
+        }
+
+        rankings, errors = [], [None] * len(queries)
+        for backend, backend_futures in futures.items():
+            remaining = self.timeouts[backend] - (monotonic() - start)
+            wait(backend_futures, timeout=max(remaining, 0))
+            ranking, backend_error = [], None
+            for q, future in enumerate(backend_futures):
+                if not future.done():
+                    self.timed_out[backend] += 1
+                    future.cancel()
+                    ranking.append(None)
+                elif future.exception() is not None:
+                    self.failed[backend] += 1
+                    errors[q] = errors[q] or future.exception()
+                    backend_error = backend_error or future.exception()
+                    ranking.append(None)
+                else:
+                    ranking.append(future.result())
+            if backend_error is not None:
+                print(f"{self.name}: {backend} search failed: {backend_error!r}")
+            rankings.append(ranking)
+
+        for q in range(len(queries)):
+            if errors[q] is not None and all(r[q] is None for r in rankings):
+                raise errors[q]
+        rankings = [[ranked or [] for ranked in ranking] for ranking in rankings]
+        return reciprocal_rank_fusion(rankings, k=self.k)
+
+    def forward(self, queries: list[str]) -> str:
+        if isinstance(queries, str):
+            queries = [queries]
+        assert isinstance(queries, list), "queries must be a list of strings"
+
+        sections = []
+        for query, texts in zip(queries, self.search(queries)):
+            sections.append(
+                f"\n\n##### Query: {query} #####"
+                + "".join(
+                    f"\n\n===== Idea {i} =====\n" + text for i, text in enumerate(texts)
+                )
+            )
+        return "\nRetrieved ideas:" + "".join(sections)
+
+    def shutdown(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from io import BytesIO
+from pathlib import Path
+from typing import Self
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+# gpt-4o downsizes anything larger than this anyway, so there is no point sending more pixels
+DEFAULT_MAX_SIZE = (2048, 2048)
+
+
+def _decode_and_resize(
+    data: bytes, max_size: tuple[int, int]
+) -> tuple[tuple[int, int], bytes]:
+    """Runs in a worker process: decode, convert to RGB and downscale, return raw pixels."""
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", max_size)  # Lets JPEG decode straight at a reduced scale
+    image = image.convert("RGB")
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return image.size, image.tobytes()
+
+
+class ImageFetcher:
+    """
+    Downloads images concurrently over pooled keep-alive connections, caches them on disk
+    keyed by URL (revalidated with their ETag / Last-Modified), and decodes plus downscales
+    them in a process pool. The result is ready for `agent.run(images=...)`.
+
+    Usage:
+        with ImageFetcher() as fetcher:
+            images = fetcher.fetch(image_urls)
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = "./.image_cache",
+        max_downloads: int = 16,
+        decode_workers: int | None = None,
+        max_size: tuple[int, int] = DEFAULT_MAX_SIZE,
+        timeout: float = 30.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.stats = {"downloaded": 0, "revalidated": 0, "bytes_downloaded": 0}
+        self._stats_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_downloads, pool_maxsize=max_downloads
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Wikimedia and others reject the default python-requests agent
+        self.session.headers["User-Agent"] = "hf-agents-course-image-fetcher/0.1"
+
+        self._downloads = ThreadPoolExecutor(
+            max_downloads, thread_name_prefix="image-download"
+        )
+        # Not forked from this process, which already runs download threads
+        self._decoders = ProcessPoolExecutor(
+            decode_workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+
+    def _cache_paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.bin", self.cache_dir / f"{key}.json"
+
+    def download(self, url: str) -> bytes:
+        """
+        Return the image bytes, from the disk cache when the server confirms they are current.
+        """
+        data_path, meta_path = self._cache_paths(url)
+        headers = {}
+        meta = {}
+        if data_path.exists() and meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            with self._stats_lock:
+                self.stats["revalidated"] += 1
+            return data_path.read_bytes()
+        response.raise_for_status()
+
+        with self._stats_lock:
+            self.stats["downloaded"] += 1
+            self.stats["bytes_downloaded"] += len(response.content)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            # Data first, then metadata, so a cache entry is only used once both are complete
+            tmp_path = data_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(response.content)
+            tmp_path.replace(data_path)
+            meta_path.write_text(
+                json.dumps({"url": url, "etag": etag, "last_modified": last_modified})
+            )
+        return response.content
+
+    def fetch(self, urls: list[str], skip_errors: bool = False) -> list[Image.Image]:
+        """
+        Download, decode and downscale `urls`, returning images in the same order.
+        Decoding starts as soon as each download finishes. With `skip_errors`, images that
+        fail to download or decode are left out instead of raising.
+        """
+        pending = {
+            self._downloads.submit(self.download, url): i for i, url in enumerate(urls)
+        }
+        decoded = {}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    if not skip_errors:
+                        raise
+                    print(f"Skipping {urls[i]}: {e}")
+                    continue
+                decoded[i] = self._decoders.submit(
+                    _decode_and_resize, data, self.max_size
+                )
+
+        images = []
+        for i in sorted(decoded):
+            try:
+                size, pixels = decoded[i].result()
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                print(f"Skipping {urls[i]}: {e}")
+                continue
+            images.append(Image.frombytes("RGB", size, pixels))
+        return images
+
+    def close(self) -> None:
+        self._downloads.shutdown()
+        self._decoders.shutdown()
+        self.session.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,338 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+from common.concurrent_ingestion import IngestionStats, ingest_concurrently
+from common.streaming_loader import (
+    LoaderStats,
+    iter_files,
+    llama_index_file_chunks,
+    stream_chunks,
+)
+
+
+@dataclass
+class FileState:
+    mtime_ns: int
+    size: int
+    sha256: str
+    node_ids: list[str]
+
+
+class IngestionManifest:
+    """
+    What was ingested from each file: its mtime, size and content hash when it was
+    ingested, and the ids of the nodes it was split into, in a sqlite file.
+
+    `fingerprint` records the chunking and embedding settings the files were ingested
+    with, when it changes every file has to be ingested again.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL, node_ids TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def files(self) -> dict[str, FileState]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime_ns, size, sha256, node_ids FROM files"
+            ).fetchall()
+        return {
+            path: FileState(mtime_ns, size, sha256, json.loads(node_ids))
+            for path, mtime_ns, size, sha256, node_ids in rows
+        }
+
+    def put_many(self, states: dict[str, FileState]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                [
+                    (path, s.mtime_ns, s.size, s.sha256, json.dumps(s.node_ids))
+                    for path, s in states.items()
+                ],
+            )
+
+    def touch_many(self, stats: dict[str, tuple[int, int]]) -> None:
+        """Record a new mtime and size for files whose content didn't change."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                [(mtime_ns, size, path) for path, (mtime_ns, size) in stats.items()],
+            )
+
+    def remove_many(self, paths: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in paths]
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+
+    @property
+    def fingerprint(self) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'fingerprint'"
+            ).fetchone()
+        return row[0] if row else None
+
+    @fingerprint.setter
+    def fingerprint(self, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (value,)
+            )
+
+
+def file_sha256(path: str | os.PathLike) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class SyncPlan:
+    # path -> (mtime_ns, size, sha256)
+    new: dict[str, tuple[int, int, str]] = field(default_factory=dict)
+    changed: dict[str, tuple[int, int, str]] = field(default_factory=dict)
+    removed: list[str] = field(default_factory=list)
+    # Files whose mtime or size changed but whose content is the same
+    touched: dict[str, tuple[int, int]] = field(default_factory=dict)
+    unchanged: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.new or self.changed or self.removed)
+
+
+@dataclass
+class SyncStats:
+    new: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    nodes_deleted: int = 0
+    nodes_added: int = 0
+    elapsed_seconds: float = 0.0
+    loader: LoaderStats | None = None
+    ingestion: IngestionStats | None = None
+
+
+def _file_chunks(item: tuple[str, str], chunk_size: int, chunk_overlap: int):
+    path, doc_id = item
+    return llama_index_file_chunks(path, chunk_size, chunk_overlap, doc_id=doc_id)
+
+
+class IncrementalIngestor:
+    """
+    Keeps `vector_store` in sync with the files under `input_dir`, only splitting and
+    embedding the files that are new or changed since the last sync.
+
+    - Files whose mtime and size match the manifest are skipped without being read.
+    - The others are hashed; if the content is the same only the manifest is updated.
+    - Nodes of changed and removed files are deleted from the vector store by the ids
+      the manifest recorded for them.
+    - New and changed files are streamed through `ingest_concurrently`. Node ids are
+      derived from the file path and content hash, so an interrupted sync that is run
+      again writes the same ids rather than duplicates.
+
+    Usage:
+        ingestor = IncrementalIngestor("./data", vector_store, embed_model, manifest)
+        stats = await ingestor.sync()
+        await ingestor.watch(interval=5.0)  # keep applying changes
+    """
+
+    def __init__(
+        self,
+        input_dir: str | Path,
+        vector_store: BasePydanticVectorStore,
+        embed_model: BaseEmbedding,
+        manifest: IngestionManifest,
+        chunk_size: int = 1024,
+        chunk_overlap: int = 200,
+        required_exts: list[str] | None = None,
+        hash_workers: int = 8,
+        delete_batch_size: int = 1000,
+        **ingest_kwargs,
+    ):
+        self.input_dir = Path(input_dir)
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.manifest = manifest
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.required_exts = required_exts
+        self.hash_workers = hash_workers
+        self.delete_batch_size = delete_batch_size
+        self.ingest_kwargs = ingest_kwargs
+        self.fingerprint = json.dumps(
+            {
+                "embed_model": self.embed_model.model_name,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+            },
+            sort_keys=True,
+        )
+
+    def plan(self, settle_seconds: float = 0.0) -> SyncPlan:
+        """
+        Compare the directory with the manifest. Files modified less than
+        `settle_seconds` ago may still be being written and are left for the next sync.
+        """
+        plan = SyncPlan()
+        previous = self.manifest.files()
+        # Ingested with other settings, nothing in the store can be kept
+        rebuild = self.manifest.fingerprint != self.fingerprint
+
+        settled_before = time.time_ns() - int(settle_seconds * 1e9)
+        current, unsettled = {}, set()
+        for path in iter_files(self.input_dir, self.required_exts):
+            stat = path.stat()
+            if stat.st_mtime_ns > settled_before:
+                unsettled.add(str(path))
+            else:
+                current[str(path)] = (stat.st_mtime_ns, stat.st_size)
+
+        plan.removed = [
+            path for path in previous if path not in current and path not in unsettled
+        ]
+        suspects = []
+        for path, (mtime_ns, size) in current.items():
+            state = previous.get(path)
+            if (
+                not rebuild
+                and state is not None
+                and (state.mtime_ns, state.size) == (mtime_ns, size)
+            ):
+                plan.unchanged += 1
+            else:
+                suspects.append(path)
+
+        with ThreadPoolExecutor(self.hash_workers) as executor:
+            hashes = executor.map(file_sha256, suspects)
+            for path, sha256 in zip(suspects, hashes):
+                mtime_ns, size = current[path]
+                state = previous.get(path)
+                if state is None:
+                    plan.new[path] = (mtime_ns, size, sha256)
+                elif rebuild or state.sha256 != sha256:
+                    plan.changed[path] = (mtime_ns, size, sha256)
+                else:
+                    plan.touched[path] = (mtime_ns, size)
+                    plan.unchanged += 1
+        return plan
+
+    async def sync(self, settle_seconds: float = 0.0) -> SyncStats:
+        start = time.perf_counter()
+        plan = await asyncio.to_thread(self.plan, settle_seconds)
+        stats = SyncStats(
+            new=len(plan.new),
+            changed=len(plan.changed),
+            removed=len(plan.removed),
+            unchanged=plan.unchanged,
+        )
+        if plan.touched:
+            self.manifest.touch_many(plan.touched)
+
+        previous = self.manifest.files() if plan.changed or plan.removed else {}
+        stale_ids = [
+            node_id
+            for path in [*plan.changed, *plan.removed]
+            for node_id in previous[path].node_ids
+        ]
+        for i in range(0, len(stale_ids), self.delete_batch_size):
+            batch = stale_ids[i : i + self.delete_batch_size]
+            await asyncio.to_thread(self.vector_store.delete_nodes, batch)
+        stats.nodes_deleted = len(stale_ids)
+        self.manifest.remove_many(plan.removed)
+
+        to_ingest = {**plan.new, **plan.changed}
+        if to_ingest:
+            doc_ids = {
+                path: hashlib.sha256(f"{path}\0{sha256}".encode()).hexdigest()[:32]
+                for path, (_, _, sha256) in to_ingest.items()
+            }
+            node_ids = defaultdict(list)
+
+            def record_ids(nodes):
+                for node in nodes:
+                    node_ids[node.node_id.split(":", 1)[0]].append(node.node_id)
+                    yield node
+
+            stats.loader = LoaderStats()
+            nodes = stream_chunks(
+                doc_ids.items(),
+                partial(
+                    _file_chunks,
+                    chunk_size=self.chunk_size,
+                    chunk_overlap=self.chunk_overlap,
+                ),
+                stats=stats.loader,
+            )
+            try:
+                stats.ingestion = await ingest_concurrently(
+                    record_ids(nodes),
+                    transformations=[],
+                    embed_model=self.embed_model,
+                    vector_store=self.vector_store,
+                    **self.ingest_kwargs,
+                )
+            finally:
+                # Stops the loader's process pool now when ingestion failed, not on GC
+                nodes.close()
+            stats.nodes_added = stats.ingestion.nodes
+            # Only recorded once every node is written, an interrupted sync starts over
+            self.manifest.put_many(
+                {
+                    path: FileState(mtime_ns, size, sha256, node_ids[doc_ids[path]])
+                    for path, (mtime_ns, size, sha256) in to_ingest.items()
+                }
+            )
+
+        self.manifest.fingerprint = self.fingerprint
+        stats.elapsed_seconds = time.perf_counter() - start
+        return stats
+
+    async def watch(self, interval: float = 5.0, settle_seconds: float = 2.0) -> None:
+        """Sync every `interval` seconds until cancelled, printing what changed."""
+        while True:
+            stats = await self.sync(settle_seconds)
+            if stats.new or stats.changed or stats.removed:
+                print(
+                    f"Synced {self.input_dir}: +{stats.new} ~{stats.changed} "
+                    f"-{stats.removed} files, +{stats.nodes_added} "
+                    f"-{stats.nodes_deleted} nodes in {stats.elapsed_seconds:.1f}s"
+                )
+            await asyncio.sleep(interval)
@@ -0,0 +1,274 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from smolagents import Model, MultiStepAgent
+from smolagents.memory import ActionStep, AgentMemory, PlanningStep, TaskStep
+from smolagents.models import MessageRole
+
+
+def approx_tokens(text: str) -> int:
+    """About 4 characters per token, close enough for budgeting without a tokenizer."""
+    return (len(text) + 3) // 4
+
+
+def _text(message) -> str:
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if part["type"] == "text")
+
+
+def _clip(text: str, chars: int, keep_tail: bool = False) -> str:
+    text = " ".join(text.split())
+    if len(text) <= chars:
+        return text
+    if keep_tail:
+        # Logs tend to end with the result, keep both ends
+        head = (chars - 5) // 2
+        return f"{text[:head]} ... {text[-(chars - 5 - head) :]}"
+    return f"{text[: chars - 3]}..."
+
+
+def fold_step(step: ActionStep, chars: int = 300) -> str:
+    """One line for an action step: what it ran and what came back, about `chars` long."""
+    parts = [f"Step {step.step_number}:"]
+    if step.tool_calls:
+        call = step.tool_calls[0]
+        action = (
+            call.arguments
+            if call.name == "python_interpreter"
+            else f"{call.name}({call.arguments})"
+        )
+        parts.append(f"ran {_clip(str(action), chars // 2)}")
+    if step.error is not None:
+        parts.append(f"-> error: {_clip(str(step.error), chars // 3, keep_tail=True)}")
+    elif step.observations:
+        parts.append(f"-> {_clip(step.observations, chars // 2, keep_tail=True)}")
+    return " ".join(parts)
+
+
+@dataclass
+class StepTokens:
+    step: int
+    input_tokens: int | None  # As reported by the model for the step's call
+    output_tokens: int | None
+    history_tokens: int  # Estimated size of the full, uncompacted history
+    sent_tokens: int  # Estimated size of the history actually sent
+    folded_steps: int
+
+
+class MemoryCompactor:
+    """
+    Keeps an agent's prompt from growing with every step.
+
+    The last `keep_last` action steps go to the model verbatim. Older steps are folded
+    into a rolling summary, one clipped line per step, and only the most recent plan is
+    kept. If the history is still over `max_tokens`, more steps are folded (down to one
+    verbatim step) and then the oldest summary lines are dropped.
+
+    With a `summarizer` model, the folded lines are condensed by the model instead, once
+    they exceed `summary_tokens`, into a summary of at most that size. The summary is
+    updated incrementally, each step is folded once.
+
+    Also a step callback, recording per-step token accounting in `steps`.
+
+    Usage:
+        compactor = MemoryCompactor(keep_last=4, max_tokens=8000).install(agent)
+        agent.run(task)
+        print(compactor.table())
+    """
+
+    def __init__(
+        self,
+        keep_last: int = 4,
+        max_tokens: int = 8000,
+        summary_tokens: int = 1000,
+        fold_chars: int = 300,
+        summarizer: Model | None = None,
+        count_tokens: Callable[[str], int] = approx_tokens,
+    ):
+        self.keep_last = keep_last
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.fold_chars = fold_chars
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.steps: list[StepTokens] = []
+
+        self._agent: MultiStepAgent | None = None
+        self._write_memory_to_messages = None
+        # id(step) -> folded line, kept for the current run's steps only
+        self._folded: dict[int, str] = {}
+        # Model-written summary and the ids of the steps it covers
+        self._summary = ""
+        self._summarized: set[int] = set()
+        self._first_step: int | None = None
+        self._last = (0, 0, 0)  # history, sent and folded steps of the last call
+
+    def install(self, agent: MultiStepAgent) -> "MemoryCompactor":
+        self._agent = agent
+        self._write_memory_to_messages = agent.write_memory_to_messages
+        agent.write_memory_to_messages = self.write_memory_to_messages
+        agent.step_callbacks.append(self)
+        return self
+
+    def _tokens(self, messages: list) -> int:
+        return sum(self.count_tokens(_text(message)) for message in messages)
+
+    def _fold(self, step: ActionStep) -> str:
+        if id(step) not in self._folded:
+            self._folded[id(step)] = fold_step(step, self.fold_chars)
+        return self._folded[id(step)]
+
+    def _summarize(self, folded: list[ActionStep]) -> list[str]:
+        """The summary lines for `folded`, condensed by the summarizer if there is one."""
+        if self.summarizer is None:
+            return [self._fold(step) for step in folded]
+        new = [step for step in folded if id(step) not in self._summarized]
+        lines = ([self._summary] if self._summary else []) + [
+            self._fold(step) for step in new
+        ]
+        if self.count_tokens("\n".join(lines)) <= self.summary_tokens:
+            return lines
+        response = self.summarizer(
+            [
+                {
+                    "role": MessageRole.USER,
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": (
+                                "Condense these notes on an agent's earlier steps into at "
+                                f"most {self.summary_tokens * 3 // 4} words. Keep every "
+                                "number, name, url and variable name that later steps may "
+                                "need, and what failed.\n\n" + "\n".join(lines)
+                            ),
+                        }
+                    ],
+                }
+            ]
+        )
+        self._summary = response.content.strip()
+        self._summarized.update(id(step) for step in new)
+        return [self._summary]
+
+    def _render(self, memory: AgentMemory, n_folded: int, summary_mode: bool):
+        actions = [step for step in memory.steps if isinstance(step, ActionStep)]
+        folded = actions[:n_folded]
+        folded_ids = {id(step) for step in folded}
+        plans = [step for step in memory.steps if isinstance(step, PlanningStep)]
+        latest_plan = plans[-1] if plans else None
+
+        summary = []
+        if folded:
+            summary = self._summarize(folded)
+            # Fit the summary in its budget, dropping its oldest lines first
+            dropped = 0
+            while (
+                len(summary) > 1
+                and self.count_tokens("\n".join(summary)) > self.summary_tokens
+            ):
+                summary.pop(0)
+                dropped += 1
+            if dropped:
+                summary.insert(0, f"({dropped} earlier steps omitted)")
+
+        messages = memory.system_prompt.to_messages(summary_mode=summary_mode)
+        summary_written = False
+        for step in memory.steps:
+            if id(step) in folded_ids:
+                if not summary_written:
+                    text = "[SUMMARY OF EARLIER STEPS]:\n" + "\n".join(summary)
+                    messages.append(
+                        {
+                            "role": MessageRole.ASSISTANT,
+                            "content": [{"type": "text", "text": text}],
+                        }
+                    )
+                    summary_written = True
+            elif isinstance(step, PlanningStep) and step is not latest_plan:
+                # Superseded by the latest plan, which restates the facts
+                continue
+            else:
+                messages.extend(step.to_messages(summary_mode=summary_mode))
+        return messages
+
+    def write_memory_to_messages(self, summary_mode: bool | None = False):
+        memory = self._agent.memory
+        current = {id(step) for step in memory.steps}
+        self._folded = {
+            key: line for key, line in self._folded.items() if key in current
+        }
+        first = id(memory.steps[0]) if memory.steps else None
+        if first != self._first_step:
+            # A new run, forget the previous run's summary
+            self._first_step = first
+            self._summary, self._summarized = "", set()
+
+        full = self._write_memory_to_messages(summary_mode=summary_mode)
+        history_tokens = self._tokens(full)
+        n_actions = sum(isinstance(step, ActionStep) for step in memory.steps)
+        n_folded = max(0, n_actions - self.keep_last)
+        messages = self._render(memory, n_folded, summary_mode)
+        while self._tokens(messages) > self.max_tokens and n_folded < n_actions - 1:
+            n_folded += 1
+            messages = self._render(memory, n_folded, summary_mode)
+
+        if not summary_mode:
+            self._last = (history_tokens, self._tokens(messages), n_folded)
+        return messages
+
+    def __call__(self, step_log, agent=None) -> None:
+        if not isinstance(step_log, ActionStep):
+            return
+        model = self._agent.model
+        history_tokens, sent_tokens, folded_steps = self._last
+        self.steps.append(
+            StepTokens(
+                step=step_log.step_number,
+                input_tokens=getattr(model, "last_input_token_count", None),
+                output_tokens=getattr(model, "last_output_token_count", None),
+                history_tokens=history_tokens,
+                sent_tokens=sent_tokens,
+                folded_steps=folded_steps,
+            )
+        )
+
+    def table(self) -> str:
+        header = (
+            f"{'step':>4} {'input tok':>10} {'output tok':>10} {'history tok':>11} "
+            f"{'sent tok':>9} {'folded':>6}"
+        )
+        rows = [header]
+        for s in self.steps:
+            rows.append(
+                f"{s.step:>4} {s.input_tokens or '-':>10} {s.output_tokens or '-':>10} "
+                f"{s.history_tokens:>11} {s.sent_tokens:>9} {s.folded_steps:>6}"
+            )
+        return "\n".join(rows)
+
+
+def compact_transcript(
+    memory: AgentMemory, keep_last: int = 4, max_tokens: int = 4000
+) -> str:
+    """
+    The task and steps of `memory` as text for a reviewing model, the last `keep_last`
+    action steps in full and the earlier ones folded to a line each, within `max_tokens`.
+    """
+    actions = [step for step in memory.steps if isinstance(step, ActionStep)]
+    recent = {id(step) for step in actions[-keep_last:]} if keep_last else set()
+    lines = []
+    for step in memory.steps:
+        if isinstance(step, TaskStep):
+            lines.append(f"Task: {step.task.strip()}")
+        elif isinstance(step, PlanningStep):
+            lines.append(f"Plan: {_clip(step.plan, 1000)}")
+        elif isinstance(step, ActionStep):
+            if id(step) in recent:
+                lines.append(fold_step(step, chars=2000))
+            else:
+                lines.append(fold_step(step))
+    # Over budget, drop the oldest steps but keep the task
+    while len(lines) > 2 and approx_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(1)
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+import uuid
+from pathlib import Path
+
+from smolagents import ChatMessage, Model, Tool
+
+MODES = ("record", "replay", "passthrough")
+
+
+class ModelCacheMissError(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _canonical(obj):
+    """json.dumps fallback for values that show up in model calls."""
+    if isinstance(obj, Tool):
+        return {"tool": obj.name, "inputs": obj.inputs, "output_type": obj.output_type}
+    if hasattr(obj, "tobytes"):  # PIL images and numpy arrays
+        return {
+            "bytes_sha256": hashlib.sha256(obj.tobytes()).hexdigest(),
+            "size": getattr(obj, "size", None),
+            "mode": getattr(obj, "mode", None),
+        }
+    return repr(obj)
+
+
+class CachedModel(Model):
+    """
+    A record/replay cache in front of any smolagents model.
+
+    Requests are keyed on a canonical hash of the messages, stop sequences, grammar, tools
+    and generation parameters (including the wrapped model's id, provider and kwargs).
+
+    Modes:
+        record: answer from the cache when possible, otherwise call the model and store the response.
+        replay: only answer from the cache, raise ModelCacheMissError otherwise. TTL is ignored,
+            so a recorded scenario replays offline and deterministically.
+        passthrough: always call the model, the cache is neither read nor written.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        cache_dir: str | Path = "./.model_cache",
+        mode: str = "record",
+        ttl: float | None = None,
+    ):
+        assert mode in MODES, f"mode must be one of {MODES}, got {mode!r}"
+        super().__init__()
+        self.model = model
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.ttl = ttl
+        self.model_id = getattr(model, "model_id", None)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(
+        self, messages, stop_sequences, grammar, tools_to_call_from, kwargs
+    ) -> str:
+        request = {
+            "model": {
+                "class": type(self.model).__name__,
+                "model_id": getattr(self.model, "model_id", None),
+                "provider": getattr(self.model, "provider", None),
+                "kwargs": getattr(self.model, "kwargs", {}),
+            },
+            "messages": messages,
+            "stop_sequences": stop_sequences,
+            "grammar": grammar,
+            "tools_to_call_from": tools_to_call_from,
+            "kwargs": kwargs,
+        }
+        payload = json.dumps(request, sort_keys=True, default=_canonical)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _load(self, key: str) -> dict | None:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        entry = json.loads(path.read_text())
+        if (
+            self.mode == "record"
+            and self.ttl is not None
+            and time.time() - entry["created_at"] > self.ttl
+        ):
+            return None
+        return entry
+
+    def _store(self, key: str, message: ChatMessage) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "created_at": time.time(),
+            "model_id": self.model_id,
+            "message": json.loads(message.model_dump_json()),
+            "input_token_count": self.model.last_input_token_count,
+            "output_token_count": self.model.last_output_token_count,
+        }
+        # Write then rename, so concurrent readers never see a partial entry. The temp
+        # name is unique, two writers recording the same request don't share it
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps(entry))
+        tmp_path.replace(path)
+
+    def __call__(
+        self,
+        messages: list[dict[str, str]],
+        stop_sequences: list[str] | None = None,
+        grammar: str | None = None,
+        tools_to_call_from: list[Tool] | None = None,
+        **kwargs,
+    ) -> ChatMessage:
+        if self.mode == "passthrough":
+            return self._call_model(
+                messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+            )
+
+        key = self._key(messages, stop_sequences, grammar, tools_to_call_from, kwargs)
+        entry = self._load(key)
+        if entry is not None:
+            self.hits += 1
+            self.last_input_token_count = entry["input_token_count"]
+            self.last_output_token_count = entry["output_token_count"]
+            return ChatMessage.from_dict(entry["message"])
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise ModelCacheMissError(
+                f"No recorded response for request {key} in {self.cache_dir}"
+            )
+
+        message = self._call_model(
+            messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+        )
+        self._store(key, message)
+        return message
+
+    def _call_model(
+        self, messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+    ) -> ChatMessage:
+        message = self.model(
+            messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            **kwargs,
+        )
+        self.last_input_token_count = self.model.last_input_token_count
+        self.last_output_token_count = self.model.last_output_token_count
+        return message
@@ -0,0 +1,83 @@
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import ClassVar
+
+from smolagents import MultiStepAgent, Tool
+
+
+class ParallelAgentsTool(Tool):
+    """
+    Lets a manager agent hand several independent tasks to a managed agent in one step.
+
+    Tasks run on a thread pool of `max_workers` threads, each with its own agent instance
+    built by `agent_factory` (an agent's memory is not thread-safe, so instances are never
+    shared between concurrent tasks, only reused once a task is done). Results come back in
+    the order of the tasks, and identical tasks that are in flight at the same time run once.
+    """
+
+    inputs: ClassVar[dict] = {
+        "tasks": {
+            "type": "array",
+            "description": "A list of independent, self-contained task strings.",
+        }
+    }
+    output_type = "array"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        agent_factory: Callable[[], MultiStepAgent],
+        max_workers: int = 4,
+    ):
+        self.name = name
+        self.description = description
+        self.agent_factory = agent_factory
+        self.max_workers = max_workers
+        self.deduplicated = 0
+        super().__init__()
+
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._idle_agents: queue.SimpleQueue[MultiStepAgent] = queue.SimpleQueue()
+        self._in_flight: dict[str, Future] = {}
+        # Reentrant, because a future that is already done runs its callback immediately
+        self._lock = threading.RLock()
+
+    def _run_task(self, task: str) -> str:
+        try:
+            agent = self._idle_agents.get_nowait()
+        except queue.Empty:
+            agent = self.agent_factory()
+        try:
+            # Same entry point the manager uses for a managed agent, memory is reset per run
+            return agent(task)
+        finally:
+            self._idle_agents.put(agent)
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def submit(self, task: str) -> Future:
+        key = " ".join(task.split())
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+
+            future = self._executor.submit(self._run_task, task)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+            return future
+
+    def forward(self, tasks: list[str]) -> list[str]:
+        assert isinstance(tasks, list), "tasks must be a list of strings"
+        futures = [self.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
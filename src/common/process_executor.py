@@ -0,0 +1,350 @@
+import multiprocessing
+import pickle
+import queue
+import threading
+from time import monotonic
+
+from smolagents import CodeAgent
+from smolagents.local_python_executor import (
+    BASE_BUILTIN_MODULES,
+    BASE_PYTHON_TOOLS,
+    DEFAULT_MAX_LEN_OUTPUT,
+    InterpreterError,
+    evaluate_python_code,
+)
+from smolagents.utils import AgentError
+
+# Pickling can fail on arbitrary objects with any of these
+PICKLE_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+# What a failing tool call is expected to raise, passed on to the code that called it
+TOOL_ERRORS = (
+    AgentError,
+    InterpreterError,
+    ArithmeticError,
+    LookupError,
+    OSError,
+    RuntimeError,
+    TypeError,
+    ValueError,
+)
+
+
+def _worker_main(conn, memory_limit_mb: int | None) -> None:
+    """
+    Runs in a worker process, forked from the forkserver with the heavy imports already loaded.
+
+    Messages from the parent:
+        ("setup", tool_names, authorized_imports, max_print_outputs_length): start a run,
+            with a fresh state
+        ("run", code, variables): execute one code step
+        ("get", name): read a variable from the state
+    Tool calls are forwarded to the parent as ("tool", name, args, kwargs), which answers
+    with (ok, result_or_exception).
+    """
+    if memory_limit_mb:
+        import resource
+
+        limit = memory_limit_mb << 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    def proxy(name: str):
+        def call_tool(*args, **kwargs):
+            conn.send(("tool", name, args, kwargs))
+            ok, value = conn.recv()
+            if not ok:
+                raise value
+            return value
+
+        return call_tool
+
+    state, tools, custom_tools = {}, {}, {}
+    authorized_imports = list(BASE_BUILTIN_MODULES)
+    max_print_outputs_length = DEFAULT_MAX_LEN_OUTPUT
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+
+        if message[0] == "setup":
+            _, tool_names, authorized_imports, max_print_outputs_length = message
+            state, custom_tools = {}, {}
+            tools = {name: proxy(name) for name in tool_names}
+        elif message[0] == "get":
+            try:
+                conn.send(("value", True, state[message[1]]))
+            except KeyError as e:
+                conn.send(("value", False, e))
+            except PICKLE_ERRORS as e:
+                conn.send(("value", False, TypeError(f"Cannot send back: {e}")))
+        elif message[0] == "run":
+            _, code, variables = message
+            state.update(variables)
+            try:
+                output, is_final_answer = evaluate_python_code(
+                    code,
+                    static_tools={**tools, **BASE_PYTHON_TOOLS},
+                    custom_tools=custom_tools,
+                    state=state,
+                    authorized_imports=authorized_imports,
+                    max_print_outputs_length=max_print_outputs_length,
+                )
+                reply = ("done", output, is_final_answer)
+            except InterpreterError as e:
+                # evaluate_python_code reports every failure of the code as one
+                reply = ("error", str(e), False)
+
+            logs = str(state.get("_print_outputs", ""))
+            try:
+                conn.send((*reply, logs))
+            except PICKLE_ERRORS:
+                # The value stays usable by later steps, only the parent gets its repr
+                conn.send((reply[0], repr(reply[1]), reply[2], logs))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb: int | None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class PythonWorkerPool:
+    """
+    A pool of prewarmed Python worker processes for CodeAgent code execution.
+
+    Workers are forked from a forkserver that imported `preload` once (pandas, geopandas,
+    plotly, ...), so neither the warm workers nor replacements for killed ones pay for
+    those imports again. `size` workers are kept idle and ready. The pool grows past
+    that when more agents lease at the same time, so concurrent agents never queue
+    behind one interpreter.
+
+    Note that the forkserver is shared by the whole process: only the `preload` list of
+    the first pool that starts it takes effect.
+    """
+
+    def __init__(
+        self,
+        preload: list[str],
+        size: int = 4,
+        memory_limit_mb: int | None = None,
+    ):
+        self.size = size
+        self.memory_limit_mb = memory_limit_mb
+        self.stats = {"started": 0, "leased": 0, "killed": 0}
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(
+            ["common.process_executor", "smolagents.local_python_executor", *preload]
+        )
+        self._idle: queue.SimpleQueue[_Worker] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(self._start())
+
+    def _start(self) -> _Worker:
+        with self._lock:
+            self.stats["started"] += 1
+        return _Worker(self._context, self.memory_limit_mb)
+
+    def lease(self) -> _Worker:
+        with self._lock:
+            self.stats["leased"] += 1
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._start()
+            if worker.process.is_alive():
+                return worker
+            self.discard(worker)
+
+    def release(self, worker: _Worker) -> None:
+        if worker.process.is_alive() and self._idle.qsize() < self.size:
+            self._idle.put(worker)
+        else:
+            self.discard(worker)
+
+    def discard(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            self.stats["killed"] += 1
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+class PooledPythonExecutor:
+    """
+    Drop-in for smolagents' LocalPythonInterpreter that runs the code steps in a pool worker.
+
+    The first step leases a worker and every later step of the run goes to that same
+    worker, so variables carry over between steps. Tool calls made by the code are
+    forwarded back to this process, where the tools (including managed agents) live.
+    A step that runs longer than `step_timeout` seconds, not counting the time spent in
+    tool calls, gets its worker killed. The same happens to a worker that dies on its
+    memory limit. Either way the step fails and the next step starts on a fresh worker.
+    """
+
+    def __init__(
+        self,
+        pool: PythonWorkerPool,
+        tools: dict,
+        authorized_imports: list[str],
+        max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
+        step_timeout: float | None = 60.0,
+    ):
+        self.pool = pool
+        self.tools = tools
+        self.authorized_imports = authorized_imports
+        self.max_print_outputs_length = max_print_outputs_length
+        self.step_timeout = step_timeout
+        # Mirrors LocalPythonInterpreter.state, which the agent reads print outputs from
+        self.state = {}
+        self._worker = None
+
+    def _lease(self) -> _Worker:
+        if self._worker is None:
+            self._worker = self.pool.lease()
+            self._worker.conn.send(
+                (
+                    "setup",
+                    list(self.tools),
+                    list(self.authorized_imports),
+                    self.max_print_outputs_length,
+                )
+            )
+        return self._worker
+
+    def _discard(self) -> None:
+        self.pool.discard(self._worker)
+        self._worker = None
+        self.state = {}
+
+    def release(self) -> None:
+        """Hand the worker back to the pool, the run's variables are dropped."""
+        if self._worker is not None:
+            self.pool.release(self._worker)
+            self._worker = None
+        self.state = {}
+
+    def get_variable(self, name: str):
+        if self._worker is None:
+            raise KeyError(name)
+        self._worker.conn.send(("get", name))
+        _, ok, value = self._worker.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def _call_tool(self, name: str, args, kwargs) -> None:
+        try:
+            reply = (True, self.tools[name](*args, **kwargs))
+        except TOOL_ERRORS as e:
+            reply = (False, e)
+        try:
+            self._worker.conn.send(reply)
+        except PICKLE_ERRORS:
+            value = reply[1]
+            if reply[0]:
+                error = TypeError(f"Tool {name} returned an unpicklable {type(value)}")
+            else:
+                error = RuntimeError(f"{type(value).__name__}: {value}")
+            self._worker.conn.send((False, error))
+
+    def __call__(self, code_action: str, additional_variables: dict) -> tuple:
+        conn = self._lease().conn
+        variables = {}
+        for name, value in additional_variables.items():
+            try:
+                pickle.dumps(value)
+                variables[name] = value
+            except PICKLE_ERRORS:
+                pass
+        conn.send(("run", code_action, variables))
+
+        remaining = self.step_timeout
+        while True:
+            started = monotonic()
+            ready = conn.poll(remaining)
+            if remaining is not None:
+                remaining -= monotonic() - started
+            if not ready:
+                self._discard()
+                raise InterpreterError(
+                    f"Code execution timed out after {self.step_timeout} seconds. The "
+                    "interpreter was restarted, variables from earlier steps are lost."
+                )
+            try:
+                message = conn.recv()
+            except EOFError:
+                exitcode = self._worker.process.exitcode
+                self._discard()
+                raise InterpreterError(
+                    f"The interpreter process died (exit code {exitcode}), most likely "
+                    "out of memory. Variables from earlier steps are lost."
+                )
+
+            if message[0] == "tool":
+                # Time spent in tools (web agents, searches, ...) is not the step's own
+                tool_started = monotonic()
+                try:
+                    self._call_tool(*message[1:])
+                except BaseException:
+                    # The worker is left waiting for the tool's reply
+                    self._discard()
+                    raise
+                if remaining is not None:
+                    remaining += monotonic() - tool_started
+                continue
+
+            kind, output, is_final_answer, logs = message
+            self.state["_print_outputs"] = logs
+            if kind == "error":
+                raise InterpreterError(output)
+            return output, logs, is_final_answer
+
+
+class PooledCodeAgent(CodeAgent):
+    """
+    A CodeAgent whose code steps run in a `PythonWorkerPool` worker instead of in-process.
+
+    A run (with reset=True) starts on a fresh worker and keeps it until the next run or
+    `release_worker()`, so variables can still be read after the run with
+    `agent.python_executor.get_variable(name)`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        worker_pool: PythonWorkerPool,
+        step_timeout: float | None = 60.0,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.python_executor = PooledPythonExecutor(
+            worker_pool,
+            tools={**self.tools, **self.managed_agents},
+            authorized_imports=self.authorized_imports,
+            max_print_outputs_length=self.python_executor.max_print_outputs_length,
+            step_timeout=step_timeout,
+        )
+
+    def run(self, task: str, stream: bool = False, reset: bool = True, **kwargs):
+        if reset:
+            self.python_executor.release()
+        return super().run(task, stream=stream, reset=reset, **kwargs)
+
+    def release_worker(self) -> None:
+        self.python_executor.release()
@@ -0,0 +1,299 @@
+import inspect
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+
+@dataclass
+class _Span:
+    name: str
+    start: float  # time.perf_counter()
+    end: float
+    thread: str
+    children: list["_Span"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def self_time(self) -> float:
+        return self.duration - sum(child.duration for child in self.children)
+
+
+class _TimedProxy:
+    """Times every call to `target`, everything else is passed through."""
+
+    def __init__(self, target, profiler: "StepProfiler", name: str):
+        self.__dict__.update(_target=target, _profiler=profiler, _name=name)
+
+    def __call__(self, *args, **kwargs):
+        with self._profiler.span(self._name):
+            return self._target(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._target, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._target, name, value)
+
+
+class StepProfiler:
+    """
+    Records where an agent's time goes, step by step.
+
+    Spans:
+        step: one agent step, from its start until its step callbacks are done
+        planning, model, memory (writing memory to messages), executor (running the code
+        action), tool:<name>, agent:<name> (a managed agent's run), callback:<name>
+    Whatever a step spends outside these spans (parsing the model output, logging, memory
+    bookkeeping) is the step's self time.
+
+    Usage:
+        profiler = StepProfiler()
+        profiler.instrument(agent)  # also registers the profiler as a step callback
+        agent.run(task)
+        print(profiler.table())
+        profiler.save("./profiles/orchestration")  # speedscope, folded stacks and the table
+    """
+
+    def __init__(self):
+        self.spans: list[_Span] = []
+        self._lock = threading.Lock()
+        # Converts the wall-clock times smolagents puts on steps to perf_counter times
+        self._clock_offset = time.time() - time.perf_counter()
+        self._t0 = time.perf_counter()
+        # id(agent) -> when its last step ended, so consecutive steps never overlap
+        self._step_ends: dict[int, float] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter())
+
+    def _record(self, name: str, start: float, end: float) -> None:
+        span = _Span(name, start, end, threading.current_thread().name)
+        with self._lock:
+            self.spans.append(span)
+
+    def timed(self, function, name: str):
+        def timed_function(*args, **kwargs):
+            with self.span(name):
+                return function(*args, **kwargs)
+
+        return timed_function
+
+    def wrap_model(self, model):
+        return _TimedProxy(model, self, "model")
+
+    def wrap_tool(self, tool):
+        # Tool.__call__ goes through forward, for tool-calling and code agents alike
+        if getattr(tool, "_profiler", None) is not self:
+            tool.forward = self.timed(tool.forward, f"tool:{tool.name}")
+            tool._profiler = self
+        return tool
+
+    def _wrap_callback(self, callback):
+        name = f"callback:{getattr(callback, '__name__', type(callback).__name__)}"
+        # smolagents passes the agent only to callbacks that take two parameters
+        if len(inspect.signature(callback).parameters) == 1:
+
+            def timed_callback(step_log):
+                with self.span(name):
+                    callback(step_log)
+        else:
+
+            def timed_callback(step_log, agent=None):
+                with self.span(name):
+                    callback(step_log, agent=agent)
+
+        return timed_callback
+
+    def instrument(self, agent, managed: bool = True):
+        """
+        Wrap the agent's model, executor, memory, tools, managed agents (recursively, unless
+        `managed` is False) and step callbacks, and register the profiler as the last
+        step callback.
+        """
+        if getattr(agent, "_profiler", None) is self:
+            return agent
+        agent._profiler = self
+        agent.model = self.wrap_model(agent.model)
+        if hasattr(agent, "python_executor"):
+            agent.python_executor = _TimedProxy(agent.python_executor, self, "executor")
+        agent.write_memory_to_messages = self.timed(
+            agent.write_memory_to_messages, "memory"
+        )
+        agent.planning_step = self.timed(agent.planning_step, "planning")
+        for tool in agent.tools.values():
+            self.wrap_tool(tool)
+        for managed_agent in agent.managed_agents.values():
+            if managed:
+                self.instrument(managed_agent)
+            managed_agent.run = self.timed(
+                managed_agent.run, f"agent:{managed_agent.name}"
+            )
+        agent.step_callbacks = [
+            self._wrap_callback(callback) for callback in agent.step_callbacks
+        ]
+        agent.step_callbacks.append(self)
+        return agent
+
+    def __call__(self, step_log, agent=None) -> None:
+        if step_log.start_time is None:
+            return
+        end = time.perf_counter()
+        start = step_log.start_time - self._clock_offset
+        thread = threading.current_thread().name
+        with self._lock:
+            # Keep the step around the spans it contains despite the clock conversion
+            earliest = start - 0.001
+            previous_end = self._step_ends.get(id(agent))
+            if previous_end is not None and step_log.step_number != 1:
+                start = max(start, previous_end)
+                earliest = max(earliest, previous_end)
+            start = min(
+                [start]
+                + [
+                    span.start
+                    for span in self.spans
+                    if span.thread == thread and earliest <= span.start < end
+                ]
+            )
+            self.spans.append(_Span("step", start, end, thread))
+            self._step_ends[id(agent)] = end
+
+    def _trees(self) -> dict[str, list[_Span]]:
+        """Nest each thread's spans, returning the root spans per thread."""
+        by_thread = defaultdict(list)
+        with self._lock:
+            for span in self.spans:
+                by_thread[span.thread].append(
+                    _Span(span.name, span.start, span.end, span.thread)
+                )
+
+        roots = {}
+        for thread, spans in by_thread.items():
+            spans.sort(key=lambda span: (span.start, -span.end))
+            stack, thread_roots = [], []
+            for span in spans:
+                while stack and span.start >= stack[-1].end:
+                    stack.pop()
+                if stack:
+                    span.end = min(span.end, stack[-1].end)
+                    stack[-1].children.append(span)
+                else:
+                    thread_roots.append(span)
+                stack.append(span)
+            roots[thread] = thread_roots
+        return roots
+
+    def table(self) -> str:
+        """Per span name: calls, total, self time and latency percentiles, across all runs."""
+        durations, self_times = defaultdict(list), defaultdict(list)
+
+        def visit(span: _Span) -> None:
+            durations[span.name].append(span.duration)
+            self_times[span.name].append(span.self_time)
+            for child in span.children:
+                visit(child)
+
+        for roots in self._trees().values():
+            for root in roots:
+                visit(root)
+        total_self = sum(sum(times) for times in self_times.values()) or 1.0
+
+        rows = [
+            (
+                f"{'span':<32} {'calls':>6} {'total s':>9} {'self s':>9} {'self %':>7} "
+                f"{'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+            )
+        ]
+        for name in sorted(self_times, key=lambda name: -sum(self_times[name])):
+            d = np.array(durations[name]) * 1e3
+            self_s = sum(self_times[name])
+            rows.append(
+                f"{name[:32]:<32} {len(d):>6} {d.sum() / 1e3:>9.2f} {self_s:>9.2f} "
+                f"{100 * self_s / total_self:>6.1f}% {d.mean():>9.1f} "
+                f"{np.percentile(d, 50):>9.1f} {np.percentile(d, 95):>9.1f} {d.max():>9.1f}"
+            )
+        return "\n".join(rows)
+
+    def folded(self) -> str:
+        """Collapsed stacks ("step;executor;tool:x <self µs>"), for flamegraph.pl or speedscope."""
+        weights = defaultdict(int)
+
+        def visit(span: _Span, stack: str) -> None:
+            stack = f"{stack};{span.name}" if stack else span.name
+            weights[stack] += round(span.self_time * 1e6)
+            for child in span.children:
+                visit(child, stack)
+
+        for roots in self._trees().values():
+            for root in roots:
+                visit(root, "")
+        return "\n".join(f"{stack} {weight}" for stack, weight in weights.items())
+
+    def speedscope(self, name: str = "agent") -> dict:
+        """An evented speedscope profile per thread, in milliseconds since the profiler started."""
+        frames, frame_index, profiles = [], {}, []
+
+        def visit(span: _Span, events: list[dict]) -> None:
+            if span.name not in frame_index:
+                frame_index[span.name] = len(frames)
+                frames.append({"name": span.name})
+            frame = frame_index[span.name]
+            events.append(
+                {"type": "O", "frame": frame, "at": (span.start - self._t0) * 1e3}
+            )
+            for child in span.children:
+                visit(child, events)
+            events.append(
+                {"type": "C", "frame": frame, "at": (span.end - self._t0) * 1e3}
+            )
+
+        for thread, roots in self._trees().items():
+            events = []
+            for root in roots:
+                visit(root, events)
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"{name} ({thread})",
+                    "unit": "milliseconds",
+                    "startValue": events[0]["at"],
+                    "endValue": events[-1]["at"],
+                    "events": events,
+                }
+            )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": name,
+            "exporter": "common.step_profiler",
+        }
+
+    def save(self, path_prefix: str | Path) -> None:
+        """Write <prefix>.speedscope.json, <prefix>.folded and <prefix>.txt (the table)."""
+        path_prefix = Path(path_prefix)
+        path_prefix.parent.mkdir(parents=True, exist_ok=True)
+        name = path_prefix.name
+        Path(f"{path_prefix}.speedscope.json").write_text(
+            json.dumps(self.speedscope(name))
+        )
+        Path(f"{path_prefix}.folded").write_text(self.folded() + "\n")
+        Path(f"{path_prefix}.txt").write_text(self.table() + "\n")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans.clear()
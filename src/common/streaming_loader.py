@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache
+from itertools import islice
+from pathlib import Path
+
+
+@dataclass
+class LoaderStats:
+    items: int = 0
+    bytes: int = 0
+    chunks: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 1e6 / max(self.elapsed_seconds, 1e-9)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / max(self.elapsed_seconds, 1e-9)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.items} items, {self.bytes / 1e6:.1f} MB, {self.chunks} chunks in "
+            f"{self.elapsed_seconds:.1f}s: {self.mb_per_second:.2f} MB/s, "
+            f"{self.chunks_per_second:.0f} chunks/s"
+        )
+
+
+def iter_files(
+    input_dir: str | os.PathLike,
+    required_exts: Iterable[str] | None = None,
+    recursive: bool = True,
+) -> Iterator[Path]:
+    """Yield the files under `input_dir` lazily, in sorted order, skipping hidden ones."""
+    required_exts = set(required_exts) if required_exts is not None else None
+    entries = sorted(os.scandir(input_dir), key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            if recursive:
+                yield from iter_files(entry.path, required_exts, recursive)
+        elif required_exts is None or Path(entry.name).suffix in required_exts:
+            yield Path(entry.path)
+
+
+def stream_chunks(
+    items: Iterable,
+    chunk_fn: Callable,
+    max_workers: int | None = None,
+    max_pending: int | None = None,
+    stats: LoaderStats | None = None,
+    log_every: float | None = 10.0,
+    inline_below: int = 4,
+) -> Iterator:
+    """
+    Run `chunk_fn(item)` in a process pool and yield the chunks, in the order of `items`.
+
+    `chunk_fn` must be picklable (a module-level function or a functools.partial of one)
+    and return `(n_bytes, chunks)`, where n_bytes is the input size for the throughput
+    numbers. At most `max_pending` items are parsed or waiting to be consumed at a time,
+    so memory stays bounded by a few items' worth of chunks whatever the corpus size.
+    Throughput is accumulated in `stats` and printed every `log_every` seconds.
+
+    Fewer than `inline_below` items are chunked in this process, starting workers (each
+    importing the splitter's library) would take longer than the work. A short input
+    gets no more workers than it has items.
+    """
+    max_workers = max_workers or os.cpu_count()
+    max_pending = max_pending or 2 * max_workers
+    stats = stats if stats is not None else LoaderStats()
+    last_log = time.perf_counter()
+
+    def account(n_bytes: int, chunks: list) -> None:
+        nonlocal last_log
+        stats.items += 1
+        stats.bytes += n_bytes
+        stats.chunks += len(chunks)
+        if log_every is not None and time.perf_counter() - last_log >= log_every:
+            print(f"Loading: {stats}")
+            last_log = time.perf_counter()
+
+    items = iter(items)
+    window = max(max_pending, inline_below)
+    head = list(islice(items, window))
+    if len(head) < window:
+        # The whole input is known
+        if len(head) < inline_below:
+            for item in head:
+                n_bytes, chunks = chunk_fn(item)
+                account(n_bytes, chunks)
+                yield from chunks
+            return
+        max_workers = min(max_workers, len(head))
+
+    # The generator is often driven from a worker thread (see common.concurrent_ingestion)
+    # while other threads are busy, forking from there is unsafe
+    executor = ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context("forkserver")
+    )
+    try:
+        pending = deque(executor.submit(chunk_fn, item) for item in head)
+        while pending:
+            n_bytes, chunks = pending.popleft().result()
+            # Refill before yielding, so the workers keep parsing while chunks are consumed
+            pending.extend(executor.submit(chunk_fn, item) for item in islice(items, 1))
+            account(n_bytes, chunks)
+            yield from chunks
+    finally:
+        # Also reached when the consumer stops early, don't parse what nobody will read
+        executor.shutdown(cancel_futures=True)
+
+
+def _stable_node_id(i: int, document) -> str:
+    return f"{document.id_}:{i}"
+
+
+@cache
+def _sentence_splitter(chunk_size: int, chunk_overlap: int, stable_ids: bool = False):
+    from llama_index.core.node_parser import SentenceSplitter
+
+    if stable_ids:
+        return SentenceSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, id_func=_stable_node_id
+        )
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def llama_index_file_chunks(
+    path: str | os.PathLike,
+    chunk_size: int = 1024,
+    chunk_overlap: int = 200,
+    doc_id: str | None = None,
+) -> tuple[int, list]:
+    """
+    Parse one file with SimpleDirectoryReader and split it into LlamaIndex nodes.
+
+    With a `doc_id`, the file's documents are "<doc_id>:<n>" and their nodes
+    "<doc_id>:<n>:<i>", so the same file content always gets the same node ids.
+    """
+    from llama_index.core import SimpleDirectoryReader
+
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    if doc_id is not None:
+        for n, document in enumerate(documents):
+            document.id_ = f"{doc_id}:{n}"
+    splitter = _sentence_splitter(chunk_size, chunk_overlap, doc_id is not None)
+    return os.path.getsize(path), splitter.get_nodes_from_documents(documents)
+
+
+@cache
+def _recursive_splitter(chunk_size: int, chunk_overlap: int, separators: tuple):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+        strip_whitespace=True,
+        separators=list(separators),
+    )
+
+
+def langchain_document_chunks(
+    documents: list,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    separators: tuple = ("\n\n", "\n", ".", " ", ""),
+) -> tuple[int, list]:
+    """Split a batch of LangChain Documents with a RecursiveCharacterTextSplitter."""
+    n_bytes = sum(len(document.page_content.encode()) for document in documents)
+    splitter = _recursive_splitter(chunk_size, chunk_overlap, tuple(separators))
+    return n_bytes, splitter.split_documents(documents)
@@ -0,0 +1,267 @@
+import random
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from time import monotonic
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+
+class BoundedBatchSpanProcessor(SpanProcessor):
+    """
+    Exports spans in batches from a background thread.
+
+    `on_end`, which runs on the agent's thread, only appends to a bounded queue. When the
+    queue is full the span is dropped and counted rather than blocking the agent.
+
+    Attributes:
+        stats (dict): queued, dropped, exported and failed span counters.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 512,
+        schedule_delay: float = 2.0,
+    ):
+        self.exporter = exporter
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = max_export_batch_size
+        self.schedule_delay = schedule_delay
+        self.stats = {"queued": 0, "dropped": 0, "exported": 0, "failed": 0}
+
+        self._spans: deque[ReadableSpan] = deque()
+        self._condition = threading.Condition()
+        # Spans queued before a force_flush, which it waits for
+        self._flush_target = 0
+        self._shutdown = False
+        self._worker = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._worker.start()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        with self._condition:
+            if self._shutdown or len(self._spans) >= self.max_queue_size:
+                self.stats["dropped"] += 1
+                return
+            self._spans.append(span)
+            self.stats["queued"] += 1
+            # Wake the worker for the first span, it starts the schedule_delay clock, and
+            # for a full batch
+            if len(self._spans) in (1, self.max_export_batch_size):
+                self._condition.notify_all()
+
+    @property
+    def _processed(self) -> int:
+        return self.stats["exported"] + self.stats["failed"]
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._spans and not self._shutdown:
+                    self._condition.wait()
+                if not self._spans:
+                    return
+                # Give a partial batch up to schedule_delay to fill, unless someone is
+                # waiting on it
+                self._condition.wait_for(
+                    lambda: (
+                        len(self._spans) >= self.max_export_batch_size
+                        or self._shutdown
+                        or self._flush_target > self._processed
+                    ),
+                    self.schedule_delay,
+                )
+                batch = [
+                    self._spans.popleft()
+                    for _ in range(min(self.max_export_batch_size, len(self._spans)))
+                ]
+
+            try:
+                ok = self.exporter.export(batch) == SpanExportResult.SUCCESS
+            except Exception as e:  # noqa: BLE001
+                # Whatever the exporter raises, the batch is lost but the worker must keep
+                # going: if it died, spans would pile up to max_queue_size and be dropped
+                # and force_flush would block until its timeout
+                print(f"span export failed: {e!r}")
+                ok = False
+            with self._condition:
+                self.stats["exported" if ok else "failed"] += len(batch)
+                self._condition.notify_all()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._condition:
+            self._flush_target = self.stats["queued"]
+            self._condition.notify_all()
+            flushed = self._condition.wait_for(
+                lambda: self._processed >= self._flush_target, timeout_millis / 1000
+            )
+        return flushed and self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        self._worker.join()
+        self.exporter.shutdown()
+
+
+@dataclass
+class TailSamplingPolicy:
+    """
+    Which finished traces to keep: traces with an error and traces slower than
+    `slow_seconds` always, the others with probability `keep_ratio`.
+    """
+
+    keep_ratio: float = 1.0
+    keep_errors: bool = True
+    slow_seconds: float | None = None
+
+    def keep(self, spans: list[ReadableSpan], root: ReadableSpan) -> bool:
+        if self.keep_errors and any(
+            span.status.status_code == StatusCode.ERROR for span in spans
+        ):
+            return True
+        duration = (root.end_time - root.start_time) / 1e9
+        if self.slow_seconds is not None and duration >= self.slow_seconds:
+            return True
+        return random.random() < self.keep_ratio
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """
+    Buffers each trace's spans until its local root span ends, then lets `policy` decide
+    whether the whole trace goes on to `next_processor`.
+
+    Buffering is bounded by `max_buffered_spans`. Past that, the oldest unfinished traces
+    are dropped and counted. Traces whose root never ends, for example a crashed run, are
+    dropped after `trace_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        next_processor: SpanProcessor,
+        policy: TailSamplingPolicy,
+        max_buffered_spans: int = 10_000,
+        trace_timeout: float = 600.0,
+    ):
+        self.next_processor = next_processor
+        self.policy = policy
+        self.max_buffered_spans = max_buffered_spans
+        self.trace_timeout = trace_timeout
+        self._stats = {"traces_kept": 0, "traces_sampled_out": 0, "spans_evicted": 0}
+
+        # trace_id -> (first seen, spans), oldest first
+        self._traces: OrderedDict[int, tuple[float, list[ReadableSpan]]] = OrderedDict()
+        self._buffered = 0
+        # Recent decisions, for spans that end after their root
+        self._decisions: OrderedDict[int, bool] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return {**self._stats, **getattr(self.next_processor, "stats", {})}
+
+    def _evict(self) -> None:
+        now = monotonic()
+        while self._traces:
+            trace_id, (first_seen, spans) = next(iter(self._traces.items()))
+            if (
+                self._buffered <= self.max_buffered_spans
+                and now - first_seen < self.trace_timeout
+            ):
+                return
+            del self._traces[trace_id]
+            self._buffered -= len(spans)
+            self._stats["spans_evicted"] += len(spans)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                _, spans = self._traces.setdefault(trace_id, (monotonic(), []))
+                spans.append(span)
+                self._buffered += 1
+                if not is_root:
+                    self._evict()
+                    return
+                del self._traces[trace_id]
+                self._buffered -= len(spans)
+                decision = self.policy.keep(spans, span)
+                self._stats["traces_kept" if decision else "traces_sampled_out"] += 1
+                self._decisions[trace_id] = decision
+                if len(self._decisions) > 1024:
+                    self._decisions.popitem(last=False)
+            else:
+                spans = [span]
+
+        if decision:
+            for kept in spans:
+                self.next_processor.on_end(kept)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.next_processor.force_flush(timeout_millis)
+
+    def shutdown(self) -> None:
+        self.next_processor.shutdown()
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends spans to a local file, one JSON object per line, in place of a collector."""
+
+    def __init__(self, path: str | Path = "./traces.jsonl"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a")
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def tracer_provider(
+    exporter: SpanExporter,
+    head_sample_ratio: float = 1.0,
+    tail_policy: TailSamplingPolicy | None = None,
+    **batch_kwargs,
+) -> tuple[TracerProvider, SpanProcessor]:
+    """
+    A TracerProvider that samples `head_sample_ratio` of the traces up front, optionally
+    tail-samples the finished ones, and exports through a BoundedBatchSpanProcessor.
+
+    Returns the provider and its processor, whose `stats` hold the sampling and export
+    counters. Call `provider.shutdown()` at exit to flush the remaining spans.
+
+    Usage:
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+        provider, processor = tracer_provider(InMemorySpanExporter())
+        SmolagentsInstrumentor().instrument(tracer_provider=provider)
+    """
+    provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(head_sample_ratio)))
+    processor = BoundedBatchSpanProcessor(exporter, **batch_kwargs)
+    if tail_policy is not None:
+        processor = TailSamplingProcessor(processor, tail_policy)
+    provider.add_span_processor(processor)
+    return provider, processor
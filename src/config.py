@@ -1,13 +1,11 @@
 import base64
+from functools import cache
 
 from pydantic import computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
 
-load_dotenv()
-
-
 class Settings(BaseSettings):
     model_config = SettingsConfigDict()
 
@@ -18,6 +16,59 @@ class Settings(BaseSettings):
     OTEL_EXPORTER_OTLP_ENDPOINT: str = "https://cloud.langfuse.com/api/public/otel"
     SERPAPI_API_KEY: str = ""
 
+    # record | replay | passthrough, see common.model_cache.CachedModel
+    MODEL_CACHE_MODE: str = "passthrough"
+    MODEL_CACHE_DIR: str = "./.model_cache"
+    MODEL_CACHE_TTL: float | None = None
+
+    # otlp | file, see common.telemetry.tracer_provider
+    TELEMETRY_EXPORTER: str = "otlp"
+    TELEMETRY_FILE: str = "./traces.jsonl"
+    TELEMETRY_HEAD_SAMPLE_RATIO: float = 1.0
+    # Tail sampling: errors and slow traces are always kept, the rest at this ratio
+    TELEMETRY_TAIL_KEEP_RATIO: float = 1.0
+    TELEMETRY_SLOW_TRACE_SECONDS: float | None = None
+
+    # Where run_orchestration / run_browser write step profiles, off when unset
+    PROFILE_DIR: str | None = None
+
+    # Address space cap for run_orchestration's code workers (common.process_executor),
+    # off when unset: numpy/plotly imports alone can reserve several GB of virtual memory
+    WORKER_MEMORY_LIMIT_MB: int | None = None
+
+    # chroma | mmap, the vector store sdr() ingests into, see common.mmap_vector_store
+    VECTOR_STORE: str = "chroma"
+    # Approximate IVF search once the mmap store holds 50k vectors: faster, but misses
+    # some of the exact top k, off by default
+    VECTOR_STORE_IVF: bool = False
+
+    # Serve repeated tasks from common.answer_cache.SemanticAnswerCache, off by default
+    ANSWER_CACHE: bool = False
+    ANSWER_CACHE_PATH: str = "./.answer_cache/answers.sqlite"
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL: float | None = 24 * 3600
+
+    # Long runs: action steps sent verbatim, the token budget for the step history and
+    # for the summary of the older steps (common.memory_compaction)
+    MEMORY_KEEP_STEPS: int = 4
+    MEMORY_MAX_TOKENS: int = 8000
+    MEMORY_SUMMARY_TOKENS: int = 1000
+
+    # Agents loaded from the hub (common.hub_agents): local artifact cache, how long a
+    # resolved branch is trusted, cache-only mode, and a directory standing in for the hub
+    HUB_CACHE_DIR: str = "./.hub_cache"
+    HUB_REF_TTL: float = 300.0
+    HUB_OFFLINE: bool = False
+    HUB_LOCAL_DIR: str | None = None
+
+    # run_serve: agents kept ready, requests allowed to wait, and per-request limits
+    SERVE_HOST: str = "127.0.0.1"
+    SERVE_PORT: int = 8000
+    SERVE_AGENTS: int = 64
+    SERVE_MAX_QUEUE: int = 256
+    SERVE_MAX_STEPS: int = 10
+    SERVE_TIMEOUT: float = 300.0
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def LANGFUSE_AUTH(self) -> str:
@@ -31,4 +82,14 @@ class Settings(BaseSettings):
         return f"Authorization=Basic {self.LANGFUSE_AUTH}"
 
 
-settings = Settings()
+@cache
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings()
+
+
+def __getattr__(name: str):
+    # `settings` is built on first access instead of at import, so importing config is cheap
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,10 @@
+import json
+import time
+from dataclasses import dataclass, field
+
 from huggingface_hub import InferenceClient
 
-from config import settings
+import config
 
 
 def base_call(client: InferenceClient):
@@ -31,47 +35,48 @@ def base_call(client: InferenceClient):
     print(output.choices[0].message.content)
 
 
+SYSTEM_PROMPT = """
+Answer the following questions as best you can. You have access to the following tools:
+
+get_weather: Get the current weather in a given location
+
+The way you use the tools is by specifying a json blob.
+Specifically, this json should have an `action` key (with the name of the tool to use) and an `action_input` key (with the input to the tool going here).
+
+The only values that should be in the "action" field are:
+get_weather: Get the current weather in a given location, args: {"location": {"type": "string"}}
+example use : 
+
+{{
+  "action": "get_weather",
+  "action_input": {"location": "New York"}
+}}
+
+ALWAYS use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about one action to take. Only one action at a time in this format:
+Action:
+
+$JSON_BLOB (inside markdown cell)
+
+Observation: the result of the action. This Observation is unique, complete, and the source of truth.
+... (this Thought/Action/Observation can repeat N times, you should take several steps when needed. The $JSON_BLOB must be formatted as markdown and only use a SINGLE action at a time.)
+
+You must always end your output with the following format:
+
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Now begin! Reminder to ALWAYS use the exact characters `Final Answer:` when you provide a definitive answer.
+"""
+
+
 def get_weather(location):
     return f"the weather in {location} is sunny with low temperatures. \n"
 
 
 def dummy_agent(client: InferenceClient):
-    SYSTEM_PROMPT = """
-    Answer the following questions as best you can. You have access to the following tools:
-    
-    get_weather: Get the current weather in a given location
-    
-    The way you use the tools is by specifying a json blob.
-    Specifically, this json should have an `action` key (with the name of the tool to use) and an `action_input` key (with the input to the tool going here).
-    
-    The only values that should be in the "action" field are:
-    get_weather: Get the current weather in a given location, args: {"location": {"type": "string"}}
-    example use : 
-    
-    {{
-      "action": "get_weather",
-      "action_input": {"location": "New York"}
-    }}
-    
-    ALWAYS use the following format:
-    
-    Question: the input question you must answer
-    Thought: you should always think about one action to take. Only one action at a time in this format:
-    Action:
-    
-    $JSON_BLOB (inside markdown cell)
-    
-    Observation: the result of the action. This Observation is unique, complete, and the source of truth.
-    ... (this Thought/Action/Observation can repeat N times, you should take several steps when needed. The $JSON_BLOB must be formatted as markdown and only use a SINGLE action at a time.)
-    
-    You must always end your output with the following format:
-    
-    Thought: I now know the final answer
-    Final Answer: the final answer to the original input question
-    
-    Now begin! Reminder to ALWAYS use the exact characters `Final Answer:` when you provide a definitive answer.
-    """
-
     # Way one, manual
     prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
     {SYSTEM_PROMPT}
@@ -104,8 +109,161 @@ def dummy_agent(client: InferenceClient):
     print(final_output)
 
 
+TOOLS = {"get_weather": get_weather}
+
+
+@dataclass
+class StepStats:
+    time_to_first_token: float | None
+    duration: float
+    tokens: int
+    stop_reason: str  # "action", "observation", "final_answer" or "end"
+
+
+@dataclass
+class ReActResult:
+    answer: str | None
+    prompt: str
+    steps: list[StepStats] = field(default_factory=list)
+
+
+def find_action(text: str) -> tuple[dict, int] | None:
+    """
+    Return the action JSON blob following `Action:` and the offset right after it,
+    or None while the blob is still incomplete.
+    """
+    start = text.find("{", text.find("Action:") + 1) if "Action:" in text else -1
+    if start == -1:
+        return None
+
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    return json.loads(text[start : i + 1]), i + 1
+                except json.JSONDecodeError:
+                    return None
+    return None
+
+
+def streaming_react_agent(
+    client: InferenceClient,
+    question: str,
+    tools: dict = TOOLS,
+    max_steps: int = 5,
+    max_new_tokens: int = 200,
+) -> ReActResult:
+    """
+    Multi-turn ReAct loop over streamed tokens.
+
+    Each turn stops generating as soon as the action JSON blob closes (the tool runs right away),
+    or when the model starts hallucinating an `Observation:`, or once the `Final Answer:` line is done.
+    The prompt is only ever appended to, so every request shares the previous one as a prefix.
+    """
+    prompt = (
+        f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n{SYSTEM_PROMPT}"
+        f"<|eot_id|><|start_header_id|>user<|end_header_id|>\n{question}"
+        "<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n"
+    )
+    result = ReActResult(answer=None, prompt=prompt)
+
+    for _ in range(max_steps):
+        start = time.perf_counter()
+        time_to_first_token = None
+        tokens = 0
+        output = ""
+        action = None
+        stop_reason = "end"
+
+        stream = client.text_generation(
+            result.prompt,
+            max_new_tokens=max_new_tokens,
+            stop=["Observation:"],
+            stream=True,
+        )
+        for token in stream:
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start
+            tokens += 1
+            output += token
+
+            if "Final Answer:" in output:
+                answer = output.split("Final Answer:", 1)[1]
+                if "\n" in answer.lstrip():
+                    stop_reason = "final_answer"
+                    break
+                continue
+            if "Observation:" in output:
+                output = output[: output.index("Observation:")]
+                stop_reason = "observation"
+                break
+            if (found := find_action(output)) is not None:
+                action, end = found
+                output = output[:end]
+                if output.count("```") % 2:
+                    # Close the markdown cell we cut the blob out of
+                    output += "\n```"
+                stop_reason = "action"
+                break
+        stream.close()
+
+        result.steps.append(
+            StepStats(
+                time_to_first_token=time_to_first_token,
+                duration=time.perf_counter() - start,
+                tokens=tokens,
+                stop_reason=stop_reason,
+            )
+        )
+        result.prompt += output
+
+        if "Final Answer:" in output:
+            result.answer = output.split("Final Answer:", 1)[1].strip()
+            return result
+
+        if action is None:
+            action = (found := find_action(output)) and found[0]
+        if action is None:
+            # No action and no answer, let the model continue from where it stopped
+            continue
+
+        tool = tools.get(action.get("action"))
+        action_input = action.get("action_input", {})
+        if tool is None:
+            observation = (
+                f"Unknown tool {action.get('action')!r}, use one of {list(tools)}."
+            )
+        elif not isinstance(action_input, dict):
+            observation = (
+                f"action_input must be an object of arguments, got {action_input!r}."
+            )
+        else:
+            try:
+                observation = tool(**action_input)
+            except TypeError as e:
+                # Wrong or missing argument names, let the model correct the call
+                observation = f"Invalid arguments for {action['action']!r}: {e}."
+        result.prompt += f"\nObservation: {observation}\n"
+
+    return result
+
+
 if __name__ == "__main__":
-    settings
+    config.settings
 
     client = InferenceClient("meta-llama/Llama-3.2-3B-Instruct")
     # if the outputs for next cells are wrong, the free model may be overloaded. You can also use this public endpoint that contains Llama-3.2-3B-Instruct
@@ -113,3 +271,8 @@ if __name__ == "__main__":
 
     # base_call(client)
     dummy_agent(client)
+
+    # result = streaming_react_agent(client, "What's the weather in London ?")
+    # print(result.answer)
+    # for step in result.steps:
+    #     print(step)
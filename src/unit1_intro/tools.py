@@ -1,4 +1,66 @@
 import inspect
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    A bounded, thread-safe LRU cache of tool results with optional expiry.
+
+    Attributes:
+        maxsize (int): Maximum number of results kept, least recently used are evicted first.
+        ttl (float or None): Seconds a result stays valid, None means forever.
+        hits (int): Calls answered from the cache.
+        misses (int): Calls that ran the function.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return (True, result) on a hit, (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, result
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, result) -> None:
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
 
 
 class Tool:
@@ -11,44 +73,154 @@ class Tool:
         func (callable): The function this tool wraps.
         arguments (list): A list of argument.
         outputs (str or list): The return type(s) of the wrapped function.
+        cache (ResultCache or None): Result cache, only set for pure tools.
     """
 
     def __init__(
-        self, name: str, description: str, func: callable, arguments: list, outputs: str
+        self,
+        name: str,
+        description: str,
+        func: callable,
+        arguments: list,
+        outputs: str,
+        cache: ResultCache | None = None,
     ):
         self.name = name
         self.description = description
         self.func = func
         self.arguments = arguments
         self.outputs = outputs
+        self.cache = cache
+        self._signature = inspect.signature(func)
+        self._registries = weakref.WeakSet()
+
+    def __setattr__(self, name, value):
+        # Any public attribute change invalidates the rendered strings
+        if not name.startswith("_"):
+            self.__dict__["_string"] = None
+            for registry in self.__dict__.get("_registries", ()):
+                registry._rendered = None
+        super().__setattr__(name, value)
 
     def to_string(self) -> str:
         """
         Return a string representation of the tool,
         including its name, description, arguments, and outputs.
+        Rendered once and reused until an attribute changes.
         """
-        args_str = ", ".join(
-            [f"{arg_name}: {arg_type}" for arg_name, arg_type in self.arguments]
-        )
+        if self._string is None:
+            args_str = ", ".join(
+                [f"{arg_name}: {arg_type}" for arg_name, arg_type in self.arguments]
+            )
 
-        return (
-            f"Tool Name: {self.name},"
-            f" Description: {self.description},"
-            f" Arguments: {args_str},"
-            f" Outputs: {self.outputs}"
-        )
+            self._string = (
+                f"Tool Name: {self.name},"
+                f" Description: {self.description},"
+                f" Arguments: {args_str},"
+                f" Outputs: {self.outputs}"
+            )
+        return self._string
+
+    def _cache_key(self, args, kwargs):
+        """
+        Normalize positional and keyword arguments into one hashable key, None if unhashable.
+        """
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.items())
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
 
     def __call__(self, *args, **kwargs):
         """
         Invoke the underlying function (callable) with provided arguments.
+        Pure tools answer repeated calls from their result cache.
         """
-        return self.func(*args, **kwargs)
+        if self.cache is None:
+            return self.func(*args, **kwargs)
+
+        key = self._cache_key(args, kwargs)
+        if key is None:
+            return self.func(*args, **kwargs)
+
+        hit, result = self.cache.get(key)
+        if not hit:
+            result = self.func(*args, **kwargs)
+            self.cache.put(key, result)
+        return result
 
 
-def tool(func):
+class ToolRegistry:
+    """
+    A set of tools whose combined system-prompt section is rendered once
+    and kept current as tools are added or removed.
+
+    Attributes:
+        tools (dict): Registered tools by name, in insertion order.
+    """
+
+    def __init__(self, tools: list[Tool] | None = None):
+        self.tools = {}
+        self._rendered = None
+        for t in tools or []:
+            self.add(t)
+
+    def add(self, tool: Tool) -> None:
+        """
+        Register a tool, replacing any tool with the same name.
+        """
+        if tool.name in self.tools:
+            self.remove(tool.name)
+        self.tools[tool.name] = tool
+        tool._registries.add(self)
+        self._rendered = None
+
+    def remove(self, name: str) -> Tool:
+        """
+        Unregister a tool by name and return it.
+        """
+        tool = self.tools.pop(name)
+        tool._registries.discard(self)
+        self._rendered = None
+        return tool
+
+    def __getitem__(self, name: str) -> Tool:
+        return self.tools[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+
+    def __iter__(self):
+        return iter(self.tools.values())
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def to_string(self) -> str:
+        """
+        Return the tools section of the system prompt, one tool per line.
+        """
+        if self._rendered is None:
+            self._rendered = "\n".join(t.to_string() for t in self.tools.values())
+        return self._rendered
+
+
+def tool(
+    func=None, *, pure: bool = False, ttl: float | None = None, maxsize: int = 128
+):
     """
     A decorator that creates a Tool instance from the given function.
+
+    Use it bare (`@tool`) or with options (`@tool(pure=True, ttl=60)`).
+    `pure=True` (implied by `ttl`) marks the function as deterministic, so its results
+    are memoized in a bounded LRU cache of `maxsize` entries that expire after `ttl` seconds.
     """
+    if func is None:
+        return lambda f: tool(f, pure=pure, ttl=ttl, maxsize=maxsize)
+
     # Get the function signature
     signature = inspect.signature(func)
 
@@ -86,10 +258,11 @@ def tool(func):
         func=func,
         arguments=arguments,
         outputs=outputs,
+        cache=ResultCache(maxsize=maxsize, ttl=ttl) if pure or ttl else None,
     )
 
 
-@tool
+@tool(pure=True)
 def calculator(a: int, b: int) -> int:
     """Multiply two integers."""
     return a * b
@@ -97,3 +270,7 @@ def calculator(a: int, b: int) -> int:
 
 print(calculator.to_string())
 # Tool Name: calculator, Description: Multiply two integers., Arguments: a: int, b: int, Outputs: int
+
+# Rendered once, reused until a tool is added, removed or changed
+registry = ToolRegistry([calculator])
+print(registry.to_string())
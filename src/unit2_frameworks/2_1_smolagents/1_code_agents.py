@@ -1,24 +1,88 @@
 import os
+from functools import cache
 
 from huggingface_hub import login
-from config import settings
+import config
 from smolagents import (
     CodeAgent,
     DuckDuckGoSearchTool,
     HfApiModel,
     tool,
     Tool,
-    VisitWebpageTool,
 )
-from opentelemetry.sdk.trace import TracerProvider
+from common.agent_server import AgentServer, serve_http
+from common.answer_cache import SemanticAnswerCache, hf_embedder, with_answer_cache
+from common.http_cache import CachedVisitWebpageTool, with_shared_cache
+from common.hub_agents import (
+    AgentArtifactCache,
+    HfHubSource,
+    HubAgentPool,
+    LocalHubSource,
+)
+from common.model_cache import CachedModel
+
+
+def hf_model(**kwargs) -> CachedModel:
+    """
+    HfApiModel behind the record/replay cache, the mode is taken from MODEL_CACHE_MODE.
+    """
+    return CachedModel(
+        HfApiModel(**kwargs),
+        cache_dir=config.settings.MODEL_CACHE_DIR,
+        mode=config.settings.MODEL_CACHE_MODE,
+        ttl=config.settings.MODEL_CACHE_TTL,
+    )
+
+
+@cache
+def answer_cache() -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        config.settings.ANSWER_CACHE_PATH,
+        hf_embedder(),
+        threshold=config.settings.ANSWER_CACHE_THRESHOLD,
+        ttl=config.settings.ANSWER_CACHE_TTL,
+    )
+
+
+def cached_answers(agent):
+    """
+    With ANSWER_CACHE on, near-identical tasks the agent was given before are answered
+    from the semantic answer cache instead of running the agent again.
+    """
+    if config.settings.ANSWER_CACHE:
+        with_answer_cache(agent, answer_cache())
+    return agent
 
-from openinference.instrumentation.smolagents import SmolagentsInstrumentor
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+def print_answer_cache_stats():
+    if config.settings.ANSWER_CACHE:
+        cache = answer_cache()
+        print(f"Answer cache: {cache.stats}, hit rate {cache.hit_rate:.0%}")
+
+
+@cache
+def hub_agents() -> HubAgentPool:
+    """
+    Agents from the hub through the local artifact cache, or from HUB_LOCAL_DIR instead
+    of the hub when it is set.
+    """
+    source = (
+        LocalHubSource(config.settings.HUB_LOCAL_DIR)
+        if config.settings.HUB_LOCAL_DIR
+        else HfHubSource(token=config.settings.HF_TOKEN)
+    )
+    return HubAgentPool(
+        AgentArtifactCache(
+            config.settings.HUB_CACHE_DIR,
+            source,
+            ref_ttl=config.settings.HUB_REF_TTL,
+            offline=config.settings.HUB_OFFLINE,
+        )
+    )
 
 
 def run_search_music():
-    agent = CodeAgent(tools=[DuckDuckGoSearchTool()], model=HfApiModel())
+    agent = CodeAgent(tools=[DuckDuckGoSearchTool()], model=hf_model())
     agent.run(
         "Search for the best music recommendations for a party at the Wayne's mansion."
     )
@@ -42,13 +106,13 @@ def suggest_menu(occasion: str) -> str:
 
 
 def run_suggest_menu():
-    agent = CodeAgent(tools=[suggest_menu], model=HfApiModel())
+    agent = CodeAgent(tools=[suggest_menu], model=hf_model())
     agent.run("Prepare a formal menu for the party.")
 
 
 def run_prep_time():
     agent = CodeAgent(
-        tools=[], model=HfApiModel(), additional_authorized_imports=["datetime"]
+        tools=[], model=hf_model(), additional_authorized_imports=["datetime"]
     )
     agent.run(
         """
@@ -66,6 +130,7 @@ def run_prep_time():
 def run_full_flow():
     agent = CodeAgent(
         tools=[DuckDuckGoSearchTool(), suggest_menu],
+        # Not cached: this agent is pushed to the hub, which expects a smolagents model class
         model=HfApiModel(),
         additional_authorized_imports=["datetime"],
     )
@@ -89,14 +154,19 @@ def run_full_flow():
 
 
 def publish_agent(agent):
-    agent.push_to_hub(f"{settings.HF_USERNAME}/AlfredAgent")
+    hub_agents().push(agent, f"{config.settings.HF_USERNAME}/AlfredAgent")
 
-    alfred_agent = agent.from_hub(
-        f"{settings.HF_USERNAME}/AlfredAgent", trust_remote_code=True
+    alfred_agent = cached_answers(
+        hub_agents().get(
+            f"{config.settings.HF_USERNAME}/AlfredAgent",
+            trust_remote_code=True,
+            model=hf_model(),
+        )
     )
     alfred_agent.run(
         "Give me the best playlist for a party at Wayne's mansion. The party idea is a 'villain masquerade' theme"
     )
+    print_answer_cache_stats()
 
 
 @tool
@@ -148,45 +218,119 @@ class SuperheroPartyThemeTool(Tool):
         )
 
 
-def run_hf_alfred_agent():
-    agent = CodeAgent(
+def alfred_agent(verbosity_level: int = 2) -> CodeAgent:
+    return CodeAgent(
         tools=[
-            DuckDuckGoSearchTool(),
-            VisitWebpageTool(),
+            with_shared_cache(DuckDuckGoSearchTool()),
+            CachedVisitWebpageTool(),
             suggest_menu,
             catering_service_tool,
             SuperheroPartyThemeTool(),
         ],
-        model=HfApiModel(),
+        model=hf_model(),
         max_steps=10,
-        verbosity_level=2,
+        verbosity_level=verbosity_level,
     )
 
+
+def run_hf_alfred_agent():
+    agent = cached_answers(alfred_agent())
+
     agent.run(
         "Give me best playlist for a party at the Wayne's mansion. The party idea is a 'villain masquerade' theme"
     )
+    print_answer_cache_stats()
+
+
+def run_serve():
+    """
+    Serves Alfred over HTTP from a pool of prebuilt agents:
+
+        curl -d '{"task": "Plan a villain masquerade"}' localhost:8000/run
+        curl localhost:8000/metrics
+    """
+    server = AgentServer(
+        lambda: cached_answers(alfred_agent(verbosity_level=0)),
+        size=config.settings.SERVE_AGENTS,
+        max_queue=config.settings.SERVE_MAX_QUEUE,
+        max_steps=config.settings.SERVE_MAX_STEPS,
+        timeout=config.settings.SERVE_TIMEOUT,
+    )
+    httpd = serve_http(server, config.settings.SERVE_HOST, config.settings.SERVE_PORT)
+    print(
+        f"Serving {config.settings.SERVE_AGENTS} agents on {config.settings.SERVE_HOST}:{config.settings.SERVE_PORT}"
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.shutdown()
+        print(f"Served: {server.metrics()}")
 
 
 def run_telemetry():
-    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = settings.OTEL_EXPORTER_OTLP_ENDPOINT
-    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = settings.OTEL_EXPORTER_OTLP_HEADERS
+    from openinference.instrumentation.smolagents import SmolagentsInstrumentor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+        OTLPSpanExporter,
+    )
+
+    from common.telemetry import (
+        JsonLinesSpanExporter,
+        TailSamplingPolicy,
+        tracer_provider,
+    )
+
+    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = (
+        config.settings.OTEL_EXPORTER_OTLP_ENDPOINT
+    )
+    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = (
+        config.settings.OTEL_EXPORTER_OTLP_HEADERS
+    )
 
-    trace_provider = TracerProvider()
-    trace_provider.add_span_processor(SimpleSpanProcessor(OTLPSpanExporter()))
+    if config.settings.TELEMETRY_EXPORTER == "file":
+        exporter = JsonLinesSpanExporter(config.settings.TELEMETRY_FILE)
+    else:
+        exporter = OTLPSpanExporter()
+    tail_policy = None
+    if (
+        config.settings.TELEMETRY_TAIL_KEEP_RATIO < 1.0
+        or config.settings.TELEMETRY_SLOW_TRACE_SECONDS is not None
+    ):
+        tail_policy = TailSamplingPolicy(
+            keep_ratio=config.settings.TELEMETRY_TAIL_KEEP_RATIO,
+            slow_seconds=config.settings.TELEMETRY_SLOW_TRACE_SECONDS,
+        )
+    # Spans are exported in batches off the agent's thread, never inline with a step
+    trace_provider, span_processor = tracer_provider(
+        exporter,
+        head_sample_ratio=config.settings.TELEMETRY_HEAD_SAMPLE_RATIO,
+        tail_policy=tail_policy,
+    )
 
     SmolagentsInstrumentor().instrument(tracer_provider=trace_provider)
 
-    agent = CodeAgent(tools=[], model=HfApiModel())
-    alfred_agent = agent.from_hub(
-        f"{settings.HF_USERNAME}/AlfredAgent", trust_remote_code=True
-    )
-    alfred_agent.run(
-        "Give me the best playlist for a party at Wayne's mansion. The party idea is a 'villain masquerade' theme"
+    alfred_agent = cached_answers(
+        hub_agents().get(
+            f"{config.settings.HF_USERNAME}/AlfredAgent",
+            trust_remote_code=True,
+            model=hf_model(),
+        )
     )
+    try:
+        alfred_agent.run(
+            "Give me the best playlist for a party at Wayne's mansion. The party idea is a 'villain masquerade' theme"
+        )
+    finally:
+        # Flushes the buffered spans, a failed run's error trace is the one to keep
+        trace_provider.shutdown()
+        print(f"Telemetry: {span_processor.stats}")
+    print_answer_cache_stats()
 
 
 if __name__ == "__main__":
-    login(token=settings.HF_TOKEN)
+    login(token=config.settings.HF_TOKEN)
 
     # run_search_music()
     # run_suggest_menu()
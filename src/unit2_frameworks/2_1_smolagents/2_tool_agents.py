@@ -1,5 +1,4 @@
 from huggingface_hub import login
-from langchain.agents import load_tools
 from smolagents import (
     ToolCallingAgent,
     DuckDuckGoSearchTool,
@@ -10,7 +9,7 @@ from smolagents import (
     load_tool,
 )
 
-from config import settings
+import config
 
 
 def run_simple_tool():
@@ -114,6 +113,8 @@ def run_tool_from_space():
 
 
 def run_tool_from_langchain():
+    from langchain.agents import load_tools
+
     model = HfApiModel("Qwen/Qwen2.5-Coder-32B-Instruct")
     search_tool = Tool.from_langchain(load_tools(["serpapi"])[0])
     agent = CodeAgent(tools=[search_tool], model=model)
@@ -123,7 +124,7 @@ def run_tool_from_langchain():
 
 
 if __name__ == "__main__":
-    login(token=settings.HF_TOKEN)
+    login(token=config.settings.HF_TOKEN)
 
     # run_simple_tool()
     # run_catering_service()
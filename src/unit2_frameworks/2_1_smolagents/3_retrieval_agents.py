@@ -1,10 +1,16 @@
+from itertools import batched
+
 from huggingface_hub import login
-from langchain_community.retrievers import BM25Retriever
-from langchain.docstore.document import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from smolagents import CodeAgent, DuckDuckGoSearchTool, HfApiModel, Tool
 
-from config import settings
+from common.bm25_index import BM25Index
+from common.hybrid_retrieval import HybridRetrieverTool
+from common.streaming_loader import (
+    LoaderStats,
+    langchain_document_chunks,
+    stream_chunks,
+)
+import config
 
 
 def run_retrieval_duckduckgo():
@@ -34,28 +40,49 @@ class PartyPlanningRetrieverTool(Tool):
     }
     output_type = "string"
 
-    def __init__(self, docs, **kwargs):
+    def __init__(self, docs=None, index_path=None, k: int = 5, **kwargs):
+        """
+        Without `index_path` the documents are indexed in memory on every construction.
+        With `index_path` an existing on-disk BM25 index is opened (memory-mapped), and
+        `docs`, if given, are appended to it.
+        """
         super().__init__(**kwargs)
-        self.retriever = BM25Retriever.from_documents(
-            docs,
-            k=5,  # Retrieve the top 5 documents
-        )
+        self.k = k
+        self.index = None
+        self.retriever = None
+
+        if index_path is not None:
+            self.index = BM25Index(index_path)
+            if docs:
+                self.index.add_documents(docs)
+        else:
+            from langchain_community.retrievers import BM25Retriever
+
+            self.retriever = BM25Retriever.from_documents(docs, k=k)
+
+    def add_documents(self, docs):
+        assert self.index is not None, "Appending requires an on-disk index_path"
+        self.index.add_documents(docs)
 
     def forward(self, query: str) -> str:
         assert isinstance(query, str), "Your search query must be a string"
 
-        docs = self.retriever.invoke(
-            query,
-        )
-        return "\nRetrieved ideas:\n" + "".join(
-            [
-                f"\n\n===== Idea {str(i)} =====\n" + doc.page_content
-                for i, doc in enumerate(docs)
+        if self.index is not None:
+            texts = [
+                self.index.get_document(doc_id)["page_content"]
+                for doc_id, _ in self.index.search(query, k=self.k)
             ]
+        else:
+            texts = [doc.page_content for doc in self.retriever.invoke(query)]
+
+        return "\nRetrieved ideas:\n" + "".join(
+            [f"\n\n===== Idea {str(i)} =====\n" + text for i, text in enumerate(texts)]
         )
 
 
 def run_search_vecdb():
+    from langchain.docstore.document import Document
+
     party_ideas = [
         {
             "text": "A superhero-themed masquerade ball with luxury decor, including gold accents and velvet curtains.",
@@ -79,21 +106,24 @@ def run_search_vecdb():
         },
     ]
 
-    source_docs = [
+    source_docs = (
         Document(page_content=doc["text"], metadata={"source": doc["source"]})
         for doc in party_ideas
-    ]
+    )
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-        add_start_index=True,
-        strip_whitespace=True,
-        separators=["\n\n", "\n", ".", " ", ""],
+    # Documents are split in batches of 256 across a process pool and streamed back in
+    # order, the same splitter settings as before (chunk_size=500, chunk_overlap=50)
+    loader_stats = LoaderStats()
+    docs_processed = list(
+        stream_chunks(
+            batched(source_docs, 256), langchain_document_chunks, stats=loader_stats
+        )
     )
-    docs_processed = text_splitter.split_documents(source_docs)
+    print(f"Split {loader_stats}")
 
     party_planning_retriever = PartyPlanningRetrieverTool(docs_processed)
+    # Persist the index once, later runs open it without re-indexing:
+    # party_planning_retriever = PartyPlanningRetrieverTool(index_path="./party_bm25_index")
     agent = CodeAgent(tools=[party_planning_retriever], model=HfApiModel())
     response = agent.run(
         "Find ideas for a luxury superhero-themed party, including entertainment, catering, and decoration options."
@@ -102,8 +132,39 @@ def run_search_vecdb():
     print(response)
 
 
+def run_hybrid_search():
+    import chromadb
+    from llama_index.embeddings.huggingface import HuggingFaceInferenceAPIEmbedding
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
+    # Keyword side: the on-disk BM25 index, see the index_path example in run_search_vecdb
+    bm25_index = BM25Index("./party_bm25_index")
+    # Semantic side: the Chroma collection ingested by unit2_frameworks/2_2_llamaindex
+    db = chromadb.PersistentClient(path="./alfred_chroma_db")
+    vector_store = ChromaVectorStore(
+        chroma_collection=db.get_or_create_collection("alfred")
+    )
+    hybrid_retriever = HybridRetrieverTool(
+        bm25_index,
+        vector_store,
+        embed_model=HuggingFaceInferenceAPIEmbedding(
+            model_name="BAAI/bge-small-en-v1.5"
+        ),
+    )
+
+    agent = CodeAgent(tools=[hybrid_retriever], model=HfApiModel())
+    try:
+        response = agent.run(
+            "Find ideas for a luxury superhero-themed party, including entertainment, catering, and decoration options."
+        )
+        print(response)
+    finally:
+        hybrid_retriever.shutdown()
+
+
 if __name__ == "__main__":
-    login(token=settings.HF_TOKEN)
+    login(token=config.settings.HF_TOKEN)
 
     # run_retrieval_duckduckgo()
     run_search_vecdb()
+    # run_hybrid_search()
@@ -1,6 +1,8 @@
 import math
 import os
+from functools import lru_cache
 
+import numpy as np
 from PIL import Image
 from huggingface_hub import login
 from smolagents import (
@@ -8,12 +10,16 @@ from smolagents import (
     HfApiModel,
     CodeAgent,
     GoogleSearchTool,
-    VisitWebpageTool,
     OpenAIServerModel,
 )
 from smolagents.utils import make_image_url, encode_image_base64
 
-from config import settings
+from common.http_cache import CachedVisitWebpageTool, with_shared_cache
+from common.memory_compaction import MemoryCompactor, compact_transcript
+from common.parallel_agents import ParallelAgentsTool
+from common.process_executor import PooledCodeAgent, PythonWorkerPool
+from common.step_profiler import StepProfiler
+import config
 
 
 @tool
@@ -70,6 +76,213 @@ def calculate_cargo_travel_time(
     return round(flight_time, 2)
 
 
+# Same constants as calculate_cargo_travel_time, shared by the batched helpers below
+EARTH_RADIUS_KM = 6371.0
+ROUTE_OVERHEAD = 1.1  # 10% for non-direct routes and air traffic controls
+TAKEOFF_LANDING_HOURS = 1.0
+
+
+def _as_coords(coords) -> np.ndarray:
+    return np.asarray(coords, dtype=float).reshape(-1, 2)
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km, broadcasting over arrays of degrees."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return EARTH_RADIUS_KM * c
+
+
+def _flight_time_hours(distance_km, cruising_speed_kmh: float | None):
+    cruising_speed_kmh = cruising_speed_kmh or 750.0
+    return distance_km * ROUTE_OVERHEAD / cruising_speed_kmh + TAKEOFF_LANDING_HOURS
+
+
+def _distance_for_flight_time(hours: float, cruising_speed_kmh: float | None) -> float:
+    cruising_speed_kmh = cruising_speed_kmh or 750.0
+    return max(hours - TAKEOFF_LANDING_HOURS, 0.0) * cruising_speed_kmh / ROUTE_OVERHEAD
+
+
+@tool
+def calculate_cargo_travel_times(
+    origins: list[tuple[float, float]],
+    destinations: list[tuple[float, float]],
+    cruising_speed_kmh: float | None = 750.0,
+) -> list[float]:
+    """
+    Calculate cargo plane travel times for many origin/destination pairs at once.
+    Prefer this over calling calculate_cargo_travel_time in a loop.
+
+    Args:
+        origins: List of (latitude, longitude) starting points. A single point is paired with every destination
+        destinations: List of (latitude, longitude) destinations. A single point is paired with every origin
+        cruising_speed_kmh: Optional cruising speed in km/h (defaults to 750 km/h for typical cargo planes)
+
+    Returns:
+        list[float]: The estimated travel time in hours for each pair, in input order
+
+    Example:
+        >>> # Chicago and Sydney to Gotham (40.7128° N, 74.0060° W)
+        >>> result = calculate_cargo_travel_times([(41.8781, -87.6298), (-33.8688, 151.2093)], [(40.7128, -74.0060)])
+    """
+    origins, destinations = _as_coords(origins), _as_coords(destinations)
+    if len(origins) != len(destinations) and 1 not in (len(origins), len(destinations)):
+        raise ValueError(
+            f"Got {len(origins)} origins and {len(destinations)} destinations: pass as "
+            "many of each, or a single point on one side, or use "
+            "calculate_cargo_travel_time_matrix for every combination"
+        )
+    distances = _haversine_km(
+        origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]
+    )
+    return np.round(_flight_time_hours(distances, cruising_speed_kmh), 2).tolist()
+
+
+@tool
+def calculate_cargo_travel_time_matrix(
+    origins: list[tuple[float, float]],
+    destinations: list[tuple[float, float]],
+    cruising_speed_kmh: float | None = 750.0,
+) -> list[list[float]]:
+    """
+    Calculate cargo plane travel times from every origin to every destination.
+
+    Args:
+        origins: List of (latitude, longitude) starting points
+        destinations: List of (latitude, longitude) destinations
+        cruising_speed_kmh: Optional cruising speed in km/h (defaults to 750 km/h for typical cargo planes)
+
+    Returns:
+        list[list[float]]: Travel times in hours, one row per origin and one column per destination
+    """
+    origins, destinations = _as_coords(origins), _as_coords(destinations)
+    distances = _haversine_km(
+        origins[:, None, 0],
+        origins[:, None, 1],
+        destinations[None, :, 0],
+        destinations[None, :, 1],
+    )
+    return np.round(_flight_time_hours(distances, cruising_speed_kmh), 2).tolist()
+
+
+class CargoTravelTimeIndex:
+    """
+    A ball tree over (latitude, longitude) points, so travel time lookups are range queries.
+
+    Attributes:
+        coords (np.ndarray): The indexed points in degrees, shape (n, 2).
+        cruising_speed_kmh (float): Cruising speed used to convert travel times to distances.
+    """
+
+    def __init__(self, coords, cruising_speed_kmh: float | None = 750.0):
+        from sklearn.neighbors import BallTree
+
+        self.coords = _as_coords(coords)
+        self.cruising_speed_kmh = cruising_speed_kmh
+        # The haversine metric expects (lat, lon) in radians and returns radians
+        self.tree = BallTree(np.radians(self.coords), metric="haversine")
+
+    def _query(self, coords, radius_km: float) -> tuple[np.ndarray, np.ndarray]:
+        indices, distances = self.tree.query_radius(
+            np.radians(_as_coords(coords)),
+            r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True,
+        )
+        return indices[0], distances[0] * EARTH_RADIUS_KM
+
+    def travel_times(self, hub_coords: tuple[float, float]) -> np.ndarray:
+        """
+        Return the travel time in hours from every indexed point to `hub_coords`.
+        """
+        hub_lat, hub_lon = _as_coords(hub_coords)[0]
+        distances = _haversine_km(
+            self.coords[:, 0], self.coords[:, 1], hub_lat, hub_lon
+        )
+        return _flight_time_hours(distances, self.cruising_speed_kmh)
+
+    def within(self, coords: tuple[float, float], max_hours: float) -> list[int]:
+        """
+        Return indices of the points reachable from `coords` in `max_hours`, nearest first.
+        """
+        indices, distances = self._query(
+            coords, _distance_for_flight_time(max_hours, self.cruising_speed_kmh)
+        )
+        return indices[np.argsort(distances)].tolist()
+
+    def same_travel_time(
+        self,
+        hub_coords: tuple[float, float],
+        hours: float,
+        tolerance_hours: float = 0.5,
+    ) -> list[int]:
+        """
+        Return indices of the points whose travel time to `hub_coords` is `hours` +/- `tolerance_hours`,
+        closest match first.
+        """
+        inner_km = _distance_for_flight_time(
+            hours - tolerance_hours, self.cruising_speed_kmh
+        )
+        outer_km = _distance_for_flight_time(
+            hours + tolerance_hours, self.cruising_speed_kmh
+        )
+        indices, distances = self._query(hub_coords, outer_km)
+
+        # The ball query returns the whole disc, keep only the ring around the target time
+        in_ring = distances >= inner_km
+        target_km = _distance_for_flight_time(hours, self.cruising_speed_kmh)
+        order = np.argsort(np.abs(distances[in_ring] - target_km))
+        return indices[in_ring][order].tolist()
+
+
+@lru_cache(maxsize=16)
+def _travel_time_index(
+    points: tuple[tuple[float, float], ...], cruising_speed_kmh: float | None
+) -> CargoTravelTimeIndex:
+    # Agents tend to query the same candidate list for several target times
+    return CargoTravelTimeIndex(points, cruising_speed_kmh)
+
+
+@tool
+def cargo_points_within_travel_time(
+    points: list[tuple[float, float]],
+    hub_coords: tuple[float, float],
+    hours: float,
+    tolerance_hours: float | None = 0.5,
+    cruising_speed_kmh: float | None = 750.0,
+) -> list[int]:
+    """
+    Find the points whose cargo plane travel time to a hub is about `hours`, for instance the factories
+    with the same transfer time to Gotham as a given filming location.
+
+    Args:
+        points: List of (latitude, longitude) candidate points
+        hub_coords: Tuple of (latitude, longitude) of the hub travel times are measured to
+        hours: The target travel time in hours, for instance one computed with calculate_cargo_travel_times
+        tolerance_hours: Optional accepted difference from `hours`, in hours (defaults to 0.5)
+        cruising_speed_kmh: Optional cruising speed in km/h (defaults to 750 km/h for typical cargo planes)
+
+    Returns:
+        list[int]: Indices into `points` of the matching points, closest to `hours` first
+
+    Example:
+        >>> # Which of Maranello and Milwaukee are as far from Gotham as Chicago (about 2.68 hours)?
+        >>> result = cargo_points_within_travel_time([(44.5294, 10.8656), (43.0389, -87.9065)], (40.7128, -74.0060), 2.68)
+    """
+    if not points:
+        return []
+    index = _travel_time_index(
+        tuple(map(tuple, _as_coords(points).tolist())), cruising_speed_kmh
+    )
+    return index.same_travel_time(
+        hub_coords, hours, 0.5 if tolerance_hours is None else tolerance_hours
+    )
+
+
 def run_simple_report():
     model = HfApiModel(model_id="Qwen/Qwen2.5-Coder-32B-Instruct", provider="together")
 
@@ -79,9 +292,12 @@ def run_simple_report():
     agent = CodeAgent(
         model=model,
         tools=[
-            GoogleSearchTool(),
-            VisitWebpageTool(),
+            with_shared_cache(GoogleSearchTool()),
+            CachedVisitWebpageTool(),
             calculate_cargo_travel_time,
+            calculate_cargo_travel_times,
+            calculate_cargo_travel_time_matrix,
+            cargo_points_within_travel_time,
         ],
         additional_authorized_imports=["pandas"],
         max_steps=20,
@@ -91,6 +307,11 @@ def run_simple_report():
     # print(report)
 
     agent.planning_interval = 4
+    compactor = MemoryCompactor(
+        keep_last=config.settings.MEMORY_KEEP_STEPS,
+        max_tokens=config.settings.MEMORY_MAX_TOKENS,
+        summary_tokens=config.settings.MEMORY_SUMMARY_TOKENS,
+    ).install(agent)
     detailed_report = agent.run(f"""
     You're an expert analyst. You make comprehensive reports after visiting many websites.
     Don't hesitate to search for many queries at once in a for loop.
@@ -99,6 +320,7 @@ def run_simple_report():
     {task}
     """)
     print(detailed_report)
+    print(compactor.table())
 
 
 def check_reasoning_and_plot(final_answer, agent_memory):
@@ -108,7 +330,7 @@ def check_reasoning_and_plot(final_answer, agent_memory):
     assert os.path.exists(filepath), "Make sure to save the plot under saved_map.png!"
     image = Image.open(filepath)
     prompt = (
-        f"Here is a user-given task and the agent steps: {agent_memory.get_succinct_steps()}. Now here is the plot that was made."
+        f"Here is a user-given task and the agent steps: {compact_transcript(agent_memory, config.settings.MEMORY_KEEP_STEPS, config.settings.MEMORY_MAX_TOKENS)}. Now here is the plot that was made."
         "Please check that the reasoning process and plot are correct: do they correctly answer the given task?"
         "First list reasons why yes/no, then write your final decision: PASS in caps lock if it is satisfactory, FAIL if it is not."
         "Don't be harsh: if the plot mostly solves the task, it should pass."
@@ -136,47 +358,80 @@ def check_reasoning_and_plot(final_answer, agent_memory):
     return True
 
 
-def run_orchestration():
+def run_orchestration(max_parallel_web_agents: int = 4):
     model = HfApiModel(
         "Qwen/Qwen2.5-Coder-32B-Instruct", provider="together", max_tokens=8096
     )
 
-    web_agent = CodeAgent(
-        model=model,
-        tools=[
-            GoogleSearchTool(),
-            VisitWebpageTool(),
-            calculate_cargo_travel_time,
-        ],
-        name="web_agent",
-        description="Browses the web to find information",
-        verbosity_level=0,
-        max_steps=10,
+    profiler = StepProfiler()
+
+    def make_web_agent():
+        web_agent = CodeAgent(
+            model=model,
+            tools=[
+                with_shared_cache(GoogleSearchTool()),
+                CachedVisitWebpageTool(),
+                calculate_cargo_travel_time,
+                calculate_cargo_travel_times,
+                calculate_cargo_travel_time_matrix,
+                cargo_points_within_travel_time,
+            ],
+            name="web_agent",
+            description="Browses the web to find information",
+            verbosity_level=0,
+            max_steps=10,
+        )
+        if config.settings.PROFILE_DIR:
+            profiler.instrument(web_agent)
+        return web_agent
+
+    web_agent = make_web_agent()
+    # Independent lookups (filming locations, factories, ...) run side by side on their own web agents
+    parallel_web_agent = ParallelAgentsTool(
+        name="parallel_web_agent",
+        description=(
+            "Runs several independent web_agent tasks concurrently and returns their reports "
+            "as a list, in the same order as the tasks. Prefer it over calling web_agent in a loop."
+        ),
+        agent_factory=make_web_agent,
+        max_workers=max_parallel_web_agents,
+    )
+
+    # The manager's code steps run in a worker forked with these imports already loaded
+    manager_imports = ["geopandas", "plotly", "shapely", "json", "pandas", "numpy"]
+    worker_pool = PythonWorkerPool(
+        preload=manager_imports,
+        size=1,
+        memory_limit_mb=config.settings.WORKER_MEMORY_LIMIT_MB,
     )
 
-    manager_agent = CodeAgent(
+    manager_agent = PooledCodeAgent(
         model=HfApiModel(
             "deepseek-ai/DeepSeek-R1", provider="together", max_tokens=8096
         ),
-        tools=[calculate_cargo_travel_time],
-        managed_agents=[web_agent],
-        additional_authorized_imports=[
-            "geopandas",
-            "plotly",
-            "shapely",
-            "json",
-            "pandas",
-            "numpy",
+        tools=[
+            calculate_cargo_travel_time,
+            calculate_cargo_travel_times,
+            calculate_cargo_travel_time_matrix,
+            cargo_points_within_travel_time,
+            parallel_web_agent,
         ],
+        managed_agents=[web_agent],
+        additional_authorized_imports=manager_imports,
+        worker_pool=worker_pool,
+        step_timeout=120,
         planning_interval=5,
         verbosity_level=2,
         final_answer_checks=[check_reasoning_and_plot],
         max_steps=15,
     )
+    if config.settings.PROFILE_DIR:
+        profiler.instrument(manager_agent)
 
     # manager_agent.visualize()
 
-    manager_agent.run("""
+    try:
+        manager_agent.run("""
     Find all Batman filming locations in the world, calculate the time to transfer via cargo plane to here (we're in Gotham, 40.7128° N, 74.0060° W).
     Also give me some supercar factories with the same cargo plane transfer time. You need at least 6 points in total.
     Represent this as spatial map of the world, with the locations represented as scatter points with a color that depends on the travel time, and save it to saved_map.png!
@@ -191,12 +446,21 @@ def run_orchestration():
     final_answer(fig)
 
     Never try to process strings using code: when you have a string to read, just print it and you'll see it.
-    """)
-    print(manager_agent.python_executor.state["fig"])
+    When you have several independent lookups, send them in one parallel_web_agent(tasks=[...]) call.
+        """)
+        print(manager_agent.python_executor.get_variable("fig"))
+    finally:
+        # Also on an agent error, so the thread pool and worker processes don't leak
+        parallel_web_agent.shutdown()
+        manager_agent.release_worker()
+        worker_pool.close()
+    if config.settings.PROFILE_DIR:
+        profiler.save(f"{config.settings.PROFILE_DIR}/orchestration")
+        print(profiler.table())
 
 
 if __name__ == "__main__":
-    login(token=settings.HF_TOKEN)
+    login(token=config.settings.HF_TOKEN)
 
     # run_simple_report()
     run_orchestration()
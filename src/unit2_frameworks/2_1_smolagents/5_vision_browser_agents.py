@@ -1,13 +1,10 @@
+import re
+from collections import deque
 from io import BytesIO
-from time import sleep
+from time import monotonic, sleep
 
-import helium
-import requests
 from PIL import Image
 from huggingface_hub import login
-from selenium import webdriver
-from selenium.webdriver import Keys
-from selenium.webdriver.common.by import By
 from smolagents import (
     OpenAIServerModel,
     CodeAgent,
@@ -16,7 +13,9 @@ from smolagents import (
     DuckDuckGoSearchTool,
 )
 
-from config import settings
+from common.image_fetcher import ImageFetcher
+from common.step_profiler import StepProfiler
+import config
 
 
 def run_images():
@@ -25,17 +24,15 @@ def run_images():
         "https://upload.wikimedia.org/wikipedia/en/9/98/Joker_%28DC_Comics_character%29.jpg",  # Joker image
     ]
 
-    images = []
-    for url in image_urls:
-        response = requests.get(url)
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-        images.append(image)
+    # Concurrent pooled downloads, cached on disk, decoded and downscaled in worker processes
+    with ImageFetcher(cache_dir="./.image_cache") as fetcher:
+        images = fetcher.fetch(image_urls)
 
     model = OpenAIServerModel(model_id="gpt-4o")
     # Instantiate the agent
     agent = CodeAgent(tools=[], model=model, max_steps=20, verbosity_level=2)
 
-    response = agent.run(
+    agent.run(
         """
         Describe the costume and makeup that the comic character in these photos is wearing and return the description.
         Tell me if the guest is The Joker or Wonder Woman.
@@ -44,6 +41,109 @@ def run_images():
     )
 
 
+# Collects each element's own visible text once, keeps the element handles in the page
+TEXT_SNAPSHOT_JS = """
+if (!window.__textIndex) {
+  window.__textIndex = {version: 0, elements: []};
+  new MutationObserver(() => { window.__textIndex.version += 1; })
+    .observe(document, {subtree: true, childList: true, characterData: true});
+}
+const positions = new Map(), elements = [], texts = [];
+const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+  const parent = node.parentElement;
+  if (!parent || !node.nodeValue.trim() || ["SCRIPT", "STYLE", "NOSCRIPT"].includes(parent.tagName)) continue;
+  if (!positions.has(parent)) {
+    if (!parent.getClientRects().length) continue;
+    positions.set(parent, elements.length);
+    elements.push(parent);
+    texts.push("");
+  }
+  texts[positions.get(parent)] += node.nodeValue;
+}
+window.__textIndex.elements = elements;
+return [location.href, window.__textIndex.version, texts];
+"""
+TEXT_INDEX_STATE_JS = (
+    "return [location.href, window.__textIndex ? window.__textIndex.version : null];"
+)
+WORD_RE = re.compile(r"\w+")
+
+
+class PageTextIndex:
+    """
+    An in-memory inverted index over the visible text of the current page.
+
+    The page is snapshotted once per navigation, then repeated finds and nth-jumps are answered
+    from the index instead of an XPath scan of the whole DOM. The snapshot is rebuilt when the
+    URL changes or a MutationObserver saw the DOM change.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.version = None
+        self.texts: list[str] = []
+        self.postings: dict[str, list[int]] = {}
+        self._matches: dict[str, list[int]] = {}
+
+    def refresh(self, driver) -> None:
+        url, version = driver.execute_script(TEXT_INDEX_STATE_JS)
+        if url == self.url and version is not None and version == self.version:
+            return
+
+        self.url, self.version, self.texts = driver.execute_script(TEXT_SNAPSHOT_JS)
+        self.postings = {}
+        for i, text in enumerate(self.texts):
+            for word in set(WORD_RE.findall(text.lower())):
+                self.postings.setdefault(word, []).append(i)
+        self._matches = {}
+
+    def _candidates(self, text: str) -> set[int] | None:
+        """
+        Elements that may contain `text`, a superset of the real matches.
+        A substring can start and end mid-word, so the first query word is matched as a
+        word suffix, the last as a prefix, inner ones exactly, and a single word anywhere.
+        """
+        words = WORD_RE.findall(text.lower())
+        if not words:
+            return None
+
+        candidates = None
+        for position, query_word in enumerate(words):
+            if len(words) == 1:
+                matches = [w for w in self.postings if query_word in w]
+            elif position == 0:
+                matches = [w for w in self.postings if w.endswith(query_word)]
+            elif position == len(words) - 1:
+                matches = [w for w in self.postings if w.startswith(query_word)]
+            else:
+                matches = [query_word] if query_word in self.postings else []
+            elements = {i for w in matches for i in self.postings[w]}
+            candidates = elements if candidates is None else candidates & elements
+            if not candidates:
+                break
+        return candidates
+
+    def find(self, text: str) -> list[int]:
+        """
+        Return the positions, in document order, of the elements whose text contains `text`.
+        """
+        if text not in self._matches:
+            candidates = self._candidates(text)
+            if candidates is None:
+                candidates = range(len(self.texts))
+            self._matches[text] = sorted(i for i in candidates if text in self.texts[i])
+        return self._matches[text]
+
+    def scroll_to(self, driver, position: int) -> None:
+        driver.execute_script(
+            "window.__textIndex.elements[arguments[0]].scrollIntoView(true);", position
+        )
+
+
+page_text_index = PageTextIndex()
+
+
 @tool
 def search_item_ctrl_f(text: str, nth_result: int = 1) -> str:
     """
@@ -52,15 +152,15 @@ def search_item_ctrl_f(text: str, nth_result: int = 1) -> str:
         text: The text to search for
         nth_result: Which occurrence to jump to (default: 1)
     """
-    elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{text}')]")
-    if nth_result > len(elements):
+    page_text_index.refresh(driver)
+    matches = page_text_index.find(text)
+    if nth_result > len(matches):
         raise Exception(
-            f"Match n°{nth_result} not found (only {len(elements)} matches found)"
+            f"Match n°{nth_result} not found (only {len(matches)} matches found)"
         )
-    result = f"Found {len(elements)} matches for '{text}'."
-    elem = elements[nth_result - 1]
-    driver.execute_script("arguments[0].scrollIntoView(true);", elem)
-    result += f"Focused on element {nth_result} of {len(elements)}"
+    result = f"Found {len(matches)} matches for '{text}'."
+    page_text_index.scroll_to(driver, matches[nth_result - 1])
+    result += f"Focused on element {nth_result} of {len(matches)}"
     return result
 
 
@@ -75,41 +175,122 @@ def close_popups() -> str:
     """
     Closes any visible modal or pop-up on the page. Use this to dismiss pop-up windows! This does not work on cookie consent banners.
     """
+    from selenium import webdriver
+    from selenium.webdriver import Keys
+
     webdriver.ActionChains(driver).send_keys(Keys.ESCAPE).perform()
 
 
-def save_screenshot(step_log: ActionStep, agent: CodeAgent) -> None:
-    sleep(1.0)  # Let JavaScript animations happen before taking the screenshot
-    driver = helium.get_driver()
-    current_step = step_log.step_number
-    if driver is not None:
-        for (
-            step_logs
-        ) in agent.logs:  # Remove previous screenshots from logs for lean processing
+# Installs a MutationObserver once per page and reports when the DOM and network last changed.
+# Only nodes being added or removed count: animations and tickers rewrite styles and text
+# continuously, watching those the page would never look settled
+SETTLE_PROBE_JS = """
+if (!window.__settle) {
+  window.__settle = {lastMutation: 0};
+  new MutationObserver(() => { window.__settle.lastMutation = performance.now(); })
+    .observe(document, {subtree: true, childList: true});
+}
+const resources = performance.getEntriesByType("resource");
+return {
+  readyState: document.readyState,
+  now: performance.now(),
+  lastMutation: window.__settle.lastMutation,
+  lastResource: resources.reduce((last, r) => Math.max(last, r.responseEnd), 0),
+  resourceCount: resources.length,
+};
+"""
+
+
+class ScreenshotManager:
+    """
+    Step callback that attaches a browser screenshot to each step.
+
+    Instead of a fixed sleep it waits until the page has settled: the document is loaded and
+    no element was added or removed and no request finished for `quiet_ms`, with `max_wait`
+    seconds as a ceiling, no more than the fixed sleep this replaces.
+    Screenshots are downscaled to `max_side` pixels and kept JPEG-compressed. Only the last
+    `max_frames` steps keep theirs: steps live in a ring buffer, and the step falling out of it
+    gets its screenshot dropped, so each call is O(1) however long the run is.
+    """
+
+    def __init__(
+        self,
+        max_frames: int = 2,
+        max_side: int = 1024,
+        jpeg_quality: int = 80,
+        quiet_ms: float = 300,
+        max_wait: float = 1.0,
+        poll_interval: float = 0.1,
+    ):
+        self.frames = deque(maxlen=max_frames)
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.quiet_ms = quiet_ms
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+
+    def wait_until_settled(self, driver) -> float:
+        """
+        Block until the page is quiet or `max_wait` has passed, return the time waited.
+        """
+        start = monotonic()
+        resource_count = None
+        while monotonic() - start < self.max_wait:
+            probe = driver.execute_script(SETTLE_PROBE_JS)
+            last_activity = max(probe["lastMutation"], probe["lastResource"])
+            if probe["resourceCount"] != resource_count:
+                # A request finished since the last poll
+                resource_count = probe["resourceCount"]
+                last_activity = probe["now"]
             if (
-                isinstance(step_log, ActionStep)
-                and step_log.step_number <= current_step - 2
+                probe["readyState"] == "complete"
+                and probe["now"] - last_activity >= self.quiet_ms
             ):
-                step_logs.observations_images = None
-        png_bytes = driver.get_screenshot_as_png()
-        image = Image.open(BytesIO(png_bytes))
-        print(f"Captured a browser screenshot: {image.size} pixels")
-        step_log.observations_images = [
-            image.copy()
-        ]  # Create a copy to ensure it persists, important!
-
-    # Update observations with current URL
-    url_info = f"Current url: {driver.current_url}"
-    step_log.observations = (
-        url_info
-        if step_logs.observations is None
-        else step_log.observations + "\n" + url_info
-    )
-    return
+                break
+            sleep(self.poll_interval)
+        return monotonic() - start
+
+    def capture(self, driver) -> Image.Image:
+        image = Image.open(BytesIO(driver.get_screenshot_as_png())).convert("RGB")
+        image.thumbnail((self.max_side, self.max_side))
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=self.jpeg_quality)
+        # Decoded lazily, so the frame stays compressed until the model reads it
+        return Image.open(BytesIO(buffer.getvalue()))
+
+    def __call__(self, step_log: ActionStep, agent: CodeAgent) -> None:
+        import helium
+
+        driver = helium.get_driver()
+        if driver is None:
+            return
+
+        waited = self.wait_until_settled(driver)
+        if len(self.frames) == self.frames.maxlen:
+            # Remove the oldest screenshot from the logs for lean processing
+            self.frames[0].observations_images = None
+        image = self.capture(driver)
+        print(f"Captured a browser screenshot: {image.size} pixels after {waited:.2f}s")
+        step_log.observations_images = [image]
+        self.frames.append(step_log)
+
+        # Update observations with current URL
+        url_info = f"Current url: {driver.current_url}"
+        step_log.observations = (
+            url_info
+            if step_log.observations is None
+            else step_log.observations + "\n" + url_info
+        )
+
+
+save_screenshot = ScreenshotManager()
 
 
 def initialize_driver():
     """Initialize the Selenium WebDriver."""
+    import helium
+    from selenium import webdriver
+
     chrome_options = webdriver.ChromeOptions()
     chrome_options.add_argument("--force-device-scale-factor=1")
     chrome_options.add_argument("--window-size=1000,1350")
@@ -186,6 +367,10 @@ def run_browser():
         verbosity_level=2,
     )
     agent.python_executor("from helium import *", agent.state)
+    profiler = StepProfiler()
+    if config.settings.PROFILE_DIR:
+        profiler.instrument(agent)
+
     agent.run(
         """
     I am Alfred, the butler of Wayne Manor, responsible for verifying the identity of guests at party. A superhero has arrived at the entrance claiming to be Wonder Woman, but I need to confirm if she is who she says she is.
@@ -194,10 +379,13 @@ def run_browser():
     """
         + helium_instructions
     )
+    if config.settings.PROFILE_DIR:
+        profiler.save(f"{config.settings.PROFILE_DIR}/browser")
+        print(profiler.table())
 
 
 if __name__ == "__main__":
-    login(token=settings.HF_TOKEN)
+    login(token=config.settings.HF_TOKEN)
 
     # run_images()
 
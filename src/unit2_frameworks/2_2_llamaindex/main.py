@@ -1,14 +1,17 @@
 import asyncio
 
 import chromadb
-from llama_index.core import SimpleDirectoryReader, Document
+from llama_index.core import Document
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.embeddings.huggingface import HuggingFaceInferenceAPIEmbedding
 from llama_index.llms.huggingface_api import HuggingFaceInferenceAPI
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
-from config import settings
+from common.embedding_cache import CachedEmbedding, EmbeddingCache
+from common.incremental_ingestion import IncrementalIngestor, IngestionManifest
+from common.mmap_vector_store import MmapVectorStore
+import config
 
 
 def call_hf_model():
@@ -16,42 +19,89 @@ def call_hf_model():
         model_name="Qwen/Qwen2.5-Coder-32B-Instruct",
         temperature=0.7,
         max_tokens=100,
-        token=settings.HF_TOKEN,
+        token=config.settings.HF_TOKEN,
     )
 
     res = llm.complete("Hello, how are you?")
     print(res)
 
 
-async def sdr():
-    reader = SimpleDirectoryReader(input_dir="./data")
-    documents = reader.load_data()
+async def sdr(watch: bool = False):
+    # Unchanged chunks are served from disk instead of being re-embedded on every run
+    embedding_cache = EmbeddingCache("./alfred_embedding_cache/embeddings.sqlite")
+    embed_model = CachedEmbedding(
+        HuggingFaceInferenceAPIEmbedding(model_name="BAAI/bge-small-en-v1.5"),
+        cache=embedding_cache,
+    )
 
     pipeline = IngestionPipeline(
         transformations=[
             SentenceSplitter(chunk_overlap=0),
-            HuggingFaceInferenceAPIEmbedding(model_name="BAAI/bge-small-en-v1.5"),  # noqa: F821
+            embed_model,
         ]
     )
 
-    nodes = await pipeline.arun(documents=[Document.example()])
+    await pipeline.arun(documents=[Document.example()])
+    print(f"Embedding cache: {embedding_cache.stats()}")
 
-    db = chromadb.PersistentClient(path="./alfred_chroma_db")
-    chroma_collection = db.get_or_create_collection("alfred")
-    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+    if config.settings.VECTOR_STORE == "mmap":
+        # int8 vectors in memory-mapped files, query workers can open the same directory
+        # with read_only=True and share it through the page cache
+        vector_store = MmapVectorStore("./alfred_mmap_index", dtype="int8")
+        stored = len(vector_store)
+        manifest_path = "./alfred_mmap_index/manifest.sqlite"
+    else:
+        db = chromadb.PersistentClient(path="./alfred_chroma_db")
+        chroma_collection = db.get_or_create_collection("alfred")
+        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+        stored = chroma_collection.count()
+        manifest_path = "./alfred_ingest_manifest.sqlite"
 
-    pipeline = IngestionPipeline(
-        transformations=[
-            SentenceSplitter(chunk_size=25, chunk_overlap=0),
-            HuggingFaceInferenceAPIEmbedding(model_name="BAAI/bge-small-en-v1.5"),
-        ],
-        vector_store=vector_store,
+    # Only new and changed files under ./data are split and embedded, nodes of changed and
+    # removed files are deleted from the collection. Files are parsed and split in a
+    # process pool and streamed in, embedding requests run concurrently and Chroma writes
+    # are flushed in large batches while later batches are still embedding
+    manifest = IngestionManifest(manifest_path)
+    if stored == 0:
+        # The collection was dropped, what the manifest says was ingested is gone
+        manifest.clear()
+    ingestor = IncrementalIngestor(
+        "./data",
+        vector_store,
+        embed_model,
+        manifest,
+        chunk_size=25,
+        chunk_overlap=0,
+        embed_batch_size=64,
+        max_concurrent_embeds=8,
+        write_batch_size=1024,
+    )
+    stats = await ingestor.sync()
+    print(
+        f"Synced ./data in {stats.elapsed_seconds:.1f}s: {stats.new} new, "
+        f"{stats.changed} changed, {stats.removed} removed, {stats.unchanged} unchanged "
+        f"files, {stats.nodes_added} nodes added, {stats.nodes_deleted} deleted"
     )
+    if stats.loader is not None:
+        print(f"Loaded {stats.loader}")
+    if isinstance(vector_store, MmapVectorStore) and (
+        stats.nodes_added or stats.nodes_deleted
+    ):
+        if stats.nodes_deleted > len(vector_store) // 4:
+            vector_store.compact()
+        if config.settings.VECTOR_STORE_IVF and len(vector_store) >= 50_000:
+            # Past this, probing inverted lists beats scanning every vector, at some
+            # recall cost which build_ivf prints
+            vector_store.build_ivf()
+    if watch:
+        await ingestor.watch(interval=5.0)
 
 
 async def main():
     # call_hf_model()
     await sdr()
+    # Keep the collection in sync with ./data as files change:
+    # await sdr(watch=True)
 
 
 if __name__ == "__main__":